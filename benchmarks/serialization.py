@@ -0,0 +1,90 @@
+"""
+Response serialisation benchmark.
+
+Measures the cost per response of serialising a 1,000-document listing along two paths:
+
+    before    validated models, re-validated as the route's response_model, passed through
+              jsonable_encoder and rendered with the standard library json module
+    after     models built with construct() and rendered directly with orjson
+
+Usage:
+    python -m benchmarks.serialization [--documents 1000] [--repeat 50]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from project.list_user_documents_service import DocumentDetail, ListUserDocumentsResponse
+from project.responses import model_response
+
+
+def _rows(count: int) -> list:
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        dict(
+            id=f"00000000-0000-0000-0000-{n:012d}",
+            fileName=f"document-{n}.pdf",
+            fileType="application/pdf",
+            fileSize=100_000 + n,
+            createdAt=str(created),
+            path=f"uploads/{n:032x}.pdf",
+            pageCount=n % 40 + 1,
+            thumbnails={
+                size: f"/thumbnails/{n:032x}-{size}.webp" for size in (64, 256, 1024)
+            },
+        )
+        for n in range(count)
+    ]
+
+
+async def _before(rows: list, field) -> bytes:
+    res = ListUserDocumentsResponse(documents=[DocumentDetail(**row) for row in rows])
+    content = await serialize_response(field=field, response_content=res)
+    return JSONResponse(content).body
+
+
+async def _after(rows: list, field) -> bytes:
+    res = ListUserDocumentsResponse.construct(
+        documents=[DocumentDetail.construct(**row) for row in rows]
+    )
+    return model_response(res).body
+
+
+async def _measure(path, rows: list, field, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await path(rows, field)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _run(documents: int, repeat: int) -> None:
+    rows = _rows(documents)
+    field = create_response_field("Response", ListUserDocumentsResponse)
+    before, after = await _before(rows, field), await _after(rows, field)
+    print(f"{documents} documents, {len(before)} / {len(after)} bytes (before / after)")
+    print(f"{'path':<10}{'median ms':>12}{'p95 ms':>12}")
+    for name, path in (("before", _before), ("after", _after)):
+        samples = sorted(await _measure(path, rows, field, repeat))
+        p95 = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+        print(f"{name:<10}{statistics.median(samples) * 1000:>12.2f}{p95 * 1000:>12.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(_run(args.documents, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
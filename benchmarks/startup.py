@@ -0,0 +1,111 @@
+"""
+Startup-time benchmark.
+
+Starts the app in fresh interpreters and reports, per phase, how long it takes until the
+first request is served and until the first watermarking work has run:
+
+    import_server        importing project.server
+    lifespan_startup     running the lifespan startup (database connection and warm-up),
+                         with the individual warm-up phases listed underneath
+    first_request        serving GET /metrics
+    first_page_index     indexing a sample PDF (loads pypdf)
+    first_stamp          rendering a text stamp (loads reportlab)
+    first_thumbnails     rendering thumbnails (loads pdfium and Pillow)
+
+Requires a reachable database (DATABASE_URL), as for running the app.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--warmup]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CHILD = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+phases = {}
+import project.server
+phases["import_server"] = time.perf_counter() - started
+
+async def main():
+    import httpx
+    import project.warmup
+    from project.page_index import build_page_index
+    from project.thumbnails import generate_thumbnails
+    from project.watermark_engine import render_stamp
+
+    app = project.server.app
+    async with app.router.lifespan_context(app):
+        phases["lifespan_startup"] = time.perf_counter() - started - sum(phases.values())
+        for phase, seconds in project.warmup.timings.items():
+            phases[f"  {phase}"] = seconds
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            t = time.perf_counter()
+            (await client.get("/metrics")).raise_for_status()
+            phases["first_request"] = time.perf_counter() - t
+        for phase, work in (
+            ("first_page_index", lambda: build_page_index(sys.argv[1])),
+            ("first_stamp", lambda: render_stamp("TEXT", "BENCHMARK", None, None, 0.5)),
+            ("first_thumbnails", lambda: generate_thumbnails(sys.argv[1])),
+        ):
+            t = time.perf_counter()
+            work()
+            phases[phase] = time.perf_counter() - t
+
+asyncio.run(main())
+print(json.dumps(phases))
+"""
+
+
+def _sample_pdf(directory: str) -> str:
+    from reportlab.pdfgen import canvas
+
+    path = os.path.join(directory, "sample.pdf")
+    c = canvas.Canvas(path)
+    for page in range(10):
+        c.drawString(72, 720, f"Startup benchmark page {page + 1}")
+        c.showPage()
+    c.save()
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="enable WARMUP")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf = _sample_pdf(directory)
+        env = dict(os.environ, UPLOAD_DIR=directory, WARMUP=str(args.warmup).lower())
+        runs = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", CHILD, pdf],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode:
+                sys.exit(result.stderr)
+            phases = json.loads(result.stdout.strip().splitlines()[-1])
+            phases["total_wall"] = time.perf_counter() - started
+            runs.append(phases)
+
+    print(f"{'phase':<28}{'median ms':>12}{'max ms':>12}")
+    for phase in runs[0]:
+        samples = [run[phase] * 1000 for run in runs if phase in run]
+        print(f"{phase:<28}{statistics.median(samples):>12.1f}{max(samples):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
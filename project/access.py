@@ -0,0 +1,76 @@
+from typing import Callable
+
+import prisma
+import prisma.enums
+from fastapi import HTTPException, Request
+
+from project.rate_limit import client_address
+from project.sessions import session_user_id
+from project.user_cache import user_cache
+
+
+def require_session() -> Callable:
+    """
+    Build a route dependency that only admits callers with a valid session.
+
+    Returns:
+        Callable: The dependency, to be used with fastapi.Depends; it resolves to the ID of
+            the user the session belongs to.
+    """
+
+    async def dependency(request: Request) -> str:
+        user_id = await session_user_id(request)
+        if user_id is None:
+            raise HTTPException(
+                status_code=401,
+                detail="A valid session is required.",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return user_id
+
+    return dependency
+
+
+def caller_id() -> Callable:
+    """
+    Build a route dependency that identifies the caller for the fair-share scheduler.
+
+    Signed-in callers are identified by their user ID, guests by their address, the same
+    way the rate limiter tells them apart.
+
+    Returns:
+        Callable: The dependency, to be used with fastapi.Depends.
+    """
+
+    async def dependency(request: Request) -> str:
+        return await session_user_id(request) or f"guest:{client_address(request)}"
+
+    return dependency
+
+
+def require_role(role: prisma.enums.Role) -> Callable:
+    """
+    Build a route dependency that only admits users with the given role.
+
+    Callers authenticate with the session token issued at login, sent as
+    `Authorization: Bearer <token>`; the role is read through the user cache, so a
+    revoked role takes effect once the cached user is invalidated.
+
+    Args:
+        role (prisma.enums.Role): Role required to call the route.
+
+    Returns:
+        Callable: The dependency, to be used with fastapi.Depends.
+    """
+
+    session = require_session()
+
+    async def dependency(request: Request) -> None:
+        user_id = await session(request)
+        user = await user_cache.get_by_id(user_id)
+        if user is None or user.role != role:
+            raise HTTPException(
+                status_code=403, detail=f"This endpoint requires the {role.value} role."
+            )
+
+    return dependency
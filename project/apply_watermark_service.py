@@ -1,7 +1,23 @@
-from typing import Optional
+import asyncio
+import contextlib
+import os
+import uuid
 
+import prisma
+import prisma.models
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
+from project.layout_analysis import analyse_pages, layout_chunks, store_layout
+from project.page_index import PageIndex, load_page_index
+from project.profiling import profile_store, run_profiled
+from project.scheduler import Priority, scheduler
+from project.storage import sidecar_path
+from project.watermark_engine import prepare_watermark, watermark_pdf
+from project.watermark_images import WatermarkImageNotFound, resolve_watermark_image
+from project.watermark_settings import Anchor, WatermarkSettings
+from project.workers import get_process_pool
+
 
 class ApplyWatermarkResponse(BaseModel):
     """
@@ -13,40 +29,112 @@ class ApplyWatermarkResponse(BaseModel):
     message: str
 
 
-class WatermarkType:
-    TEXT: str = "TEXT"
-    IMAGE: str = "IMAGE"
+async def _analyse_layout(
+    upload_path: str, index: PageIndex, user_id: str
+) -> PageIndex:
+    """
+    Analyse the layout of the pages not analysed before on the worker processes, taking
+    one bulk scheduler slot per chunk of pages so a long document queues fairly with other
+    jobs instead of fanning out over the whole pool.
+    """
+    index, chunks = await run_in_threadpool(layout_chunks, upload_path, index)
+    loop = asyncio.get_running_loop()
+
+    async def analyse(chunk):
+        async with scheduler.slot(user_id, Priority.BULK):
+            return await loop.run_in_executor(
+                get_process_pool(), analyse_pages, upload_path, chunk
+            )
+
+    results = await asyncio.gather(*(analyse(chunk) for chunk in chunks))
+    grids = {
+        info.number: grid
+        for chunk, chunk_grids in zip(chunks, results)
+        for info, grid in zip(chunk, chunk_grids)
+    }
+    return await run_in_threadpool(store_layout, upload_path, index, grids)
 
 
-def apply_watermark(
-    document_id: str,
-    watermark_type: WatermarkType,
-    text_content: Optional[str],
-    image_file: Optional[str],
-    opacity: float,
-    position: str,
-    scale: float,
-    rotation: float,
+async def apply_watermark(
+    document_id: str, watermark_settings: WatermarkSettings, caller_id: str
 ) -> ApplyWatermarkResponse:
     """
     Apply the watermark to the selected PDF document.
 
-    ** THIS FUNCTION IS A MOCK IMPLEMENTATION. IN A REAL-WORLD SCENARIO, THIS FUNCTION SHOULD
-    INTRODUCE LOGIC TO MODIFY PDF DOCUMENTS BASED ON THE SPECIFIED PARAMETERS. **
+    The watermark is rendered once and merged onto each page, positioned from the upload's page
+    index. Automatic placement analyses the layout of pages not analysed before, in parallel
+    across the worker processes with a scheduler slot per chunk of pages, and stores the
+    result in the index. CPU-bound steps run as bulk jobs on the fair-share scheduler,
+    behind interactive previews. Image watermarks are drawn from the stored image of one of
+    the uploader's templates. The settings used and the resulting file are recorded as
+    WatermarkSetting and WatermarkedPDF rows in one transaction, once the file has been
+    written. With PROFILE_SAMPLE_RATE set, a share of the jobs is profiled in the worker.
 
     Args:
         document_id (str): The unique identifier of the PDF document to be watermarked.
-        watermark_type (WatermarkType): Specifies the type of watermark to apply; could be 'text' or 'image'.
-        text_content (Optional[str]): The text content of the watermark. Applicable if watermark_type is 'text'.
-        image_file (Optional[str]): The image file of the watermark. Applicable if watermark_type is 'image'.
-        opacity (float): The opacity level of the watermark, ranging from 0 to 1.
-        position (str): The position of the watermark on the document.
-        scale (float): The scale of the watermark relative to the page size.
-        rotation (float): The rotation angle of the watermark, in degrees.
+        watermark_settings (WatermarkSettings): The watermark's type, content, opacity,
+            placement, scale and rotation, validated when the request is parsed.
+        caller_id (str): The caller's user ID, or guest address, that the job is scheduled
+            under.
 
     Returns:
         ApplyWatermarkResponse: Confirms the watermark application process and provides the updated document's reference.
     """
+    upload = await prisma.models.Upload.prisma().find_unique(where={"id": document_id})
+    if not upload:
+        return ApplyWatermarkResponse(
+            success=False, document_id=document_id, message="Document not found."
+        )
+    try:
+        watermark_settings = await resolve_watermark_image(
+            watermark_settings, upload.userId
+        )
+    except WatermarkImageNotFound:
+        return ApplyWatermarkResponse(
+            success=False,
+            document_id=document_id,
+            message="Watermark image not found.",
+        )
+    async with scheduler.slot(caller_id, Priority.BULK):
+        index = await run_in_threadpool(load_page_index, upload.path)
+        watermark = await run_in_threadpool(prepare_watermark, watermark_settings)
+    if watermark_settings.position is Anchor.AUTO:
+        index = await _analyse_layout(upload.path, index, caller_id)
+    setting_id = str(uuid.uuid4())
+    output_path = sidecar_path(upload.path, f"{setting_id}.pdf")
+    try:
+        async with scheduler.slot(caller_id, Priority.BULK):
+            file_size, profile = await asyncio.get_running_loop().run_in_executor(
+                get_process_pool(),
+                run_profiled,
+                profile_store.sample("apply", upload.id),
+                watermark_pdf,
+                upload.path,
+                output_path,
+                index,
+                watermark,
+            )
+        profile_store.record(profile)
+        async with prisma.get_client().tx() as transaction:
+            await prisma.models.WatermarkSetting.prisma(transaction).create(
+                data={"id": setting_id, **watermark_settings.setting_data(upload.userId)}
+            )
+            watermarked = await prisma.models.WatermarkedPDF.prisma(transaction).create(
+                data={
+                    "originalUploadId": upload.id,
+                    "watermarkSettingId": setting_id,
+                    "fileName": f"watermarked-{upload.fileName}",
+                    "fileSize": file_size,
+                    "path": output_path,
+                }
+            )
+    except BaseException:
+        # Neither row exists, so nothing would ever find or delete the file.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(output_path)
+        raise
     return ApplyWatermarkResponse(
-        success=True, document_id=document_id, message="Watermark successfully applied."
+        success=True,
+        document_id=watermarked.id,
+        message="Watermark successfully applied.",
     )
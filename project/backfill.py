@@ -0,0 +1,304 @@
+"""
+Re-watermark existing uploads in bulk.
+
+Streams Upload rows in id order, in chunks, and watermarks each upload on a local process
+pool with the given settings. Every processed chunk is recorded with create_many, one
+WatermarkSetting and one WatermarkedPDF row per upload, and then checkpointed. Running the
+same command again resumes after the last checkpointed chunk. Row IDs and output paths are
+derived from the run and the upload, so a chunk that is redone after an interruption
+overwrites its files and skips the rows it already wrote.
+
+Uploads that fail are logged and listed, with the error, in <checkpoint>.failed.
+Image watermarks name a WatermarkTemplate by ID, as in the API; its stored image is used for
+every upload, whoever owns it.
+
+Usage:
+    python -m project.backfill settings.json [--checkpoint backfill.checkpoint.json]
+        [--chunk-size 256] [--workers N] [--restart]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+import prisma
+import prisma.models
+from prisma import Prisma
+from pydantic import BaseModel
+
+from project.layout_analysis import ensure_layout
+from project.page_index import load_page_index
+from project.storage import sidecar_path
+from project.watermark_engine import prepare_watermark, watermark_pdf
+from project.watermark_images import WatermarkImageNotFound, resolve_watermark_image
+from project.watermark_settings import Anchor, WatermarkSettings
+from project.workers import WORKER_PROCESSES
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 0.5
+
+
+class Checkpoint(BaseModel):
+    """
+    Progress of a backfill run: the settings applied and the last upload fully recorded.
+    """
+
+    run_id: str
+    settings: WatermarkSettings
+    last_id: Optional[str] = None
+    processed: int = 0
+    failed: int = 0
+
+
+def load_checkpoint(
+    path: str, settings: WatermarkSettings, restart: bool
+) -> Checkpoint:
+    """
+    Resume the run recorded in a checkpoint file, or start a new one.
+
+    Args:
+        path (str): Path of the checkpoint file.
+        settings (WatermarkSettings): Settings the run applies.
+        restart (bool): Start a new run even if a checkpoint exists.
+
+    Returns:
+        Checkpoint: The checkpoint to continue from.
+
+    Raises:
+        SystemExit: If the checkpoint was written by a run with different settings.
+    """
+    if os.path.exists(path) and not restart:
+        checkpoint = Checkpoint.parse_file(path)
+        if checkpoint.settings != settings:
+            raise SystemExit(
+                f"{path} belongs to a run with different settings; pass --restart to start over"
+            )
+        return checkpoint
+    return Checkpoint(run_id=str(uuid.uuid4()), settings=settings)
+
+
+def save_checkpoint(path: str, checkpoint: Checkpoint) -> None:
+    """
+    Write a checkpoint file atomically.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(checkpoint.json())
+    os.replace(tmp_path, path)
+
+
+def watermark_upload(
+    upload_path: str, output_path: str, watermark_settings: WatermarkSettings
+) -> int:
+    """
+    Watermark one upload, indexing it and analysing its layout first if needed. Runs in a worker process.
+
+    Returns:
+        int: Size of the written file in bytes.
+    """
+    index = load_page_index(upload_path)
+    if watermark_settings.position is Anchor.AUTO:
+        index = ensure_layout(upload_path, index)
+    watermark = prepare_watermark(watermark_settings)
+    return watermark_pdf(upload_path, output_path, index, watermark)
+
+
+class Progress:
+    """
+    Prints a live progress line with throughput and estimated time remaining.
+    """
+
+    def __init__(self, done: int, total: int, failed: int):
+        self.done = done
+        self.total = total
+        self.failed = failed
+        self._start_done = done
+        self._started = time.monotonic()
+        self._printed = 0.0
+
+    def advance(self, failed: bool = False) -> None:
+        self.done += 1
+        self.failed += failed
+        if time.monotonic() - self._printed >= PROGRESS_INTERVAL:
+            self.show()
+
+    def show(self, end: str = "") -> None:
+        self._printed = time.monotonic()
+        elapsed = self._printed - self._started
+        rate = (self.done - self._start_done) / elapsed if elapsed else 0.0
+        eta = (
+            str(timedelta(seconds=int((self.total - self.done) / rate)))
+            if rate
+            else "--:--:--"
+        )
+        sys.stderr.write(
+            f"\r{self.done:,}/{self.total:,} uploads  {rate:,.1f}/s  "
+            f"ETA {eta}  {self.failed:,} failed{end}"
+        )
+        sys.stderr.flush()
+
+
+async def _fetch_chunk(last_id: Optional[str], size: int) -> List[prisma.models.Upload]:
+    return await prisma.models.Upload.prisma().find_many(
+        where={"id": {"gt": last_id}} if last_id else None,
+        order={"id": "asc"},
+        take=size,
+    )
+
+
+async def _process_chunk(
+    uploads: List[prisma.models.Upload],
+    checkpoint: Checkpoint,
+    watermark_settings: WatermarkSettings,
+    pool: Executor,
+    progress: Progress,
+    failures: TextIO,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    loop = asyncio.get_running_loop()
+    run = uuid.UUID(checkpoint.run_id)
+
+    async def one(upload: prisma.models.Upload) -> Optional[Tuple[Dict, Dict]]:
+        setting_id = str(uuid.uuid5(run, upload.id))
+        output_path = sidecar_path(upload.path, f"{setting_id}.pdf")
+        try:
+            file_size = await loop.run_in_executor(
+                pool, watermark_upload, upload.path, output_path, watermark_settings
+            )
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            logger.warning("Failed to watermark upload %s: %s", upload.id, e)
+            failures.write(f"{upload.id}\t{e}\n")
+            progress.advance(failed=True)
+            return None
+        progress.advance()
+        setting = {"id": setting_id, **watermark_settings.setting_data(upload.userId)}
+        watermarked = {
+            "id": str(uuid.uuid5(run, f"watermarked:{upload.id}")),
+            "originalUploadId": upload.id,
+            "watermarkSettingId": setting_id,
+            "fileName": f"watermarked-{upload.fileName}",
+            "fileSize": file_size,
+            "path": output_path,
+        }
+        return setting, watermarked
+
+    results = [r for r in await asyncio.gather(*map(one, uploads)) if r is not None]
+    return [r[0] for r in results], [r[1] for r in results]
+
+
+async def backfill(
+    watermark_settings: WatermarkSettings,
+    checkpoint_path: str,
+    chunk_size: int,
+    workers: int,
+    restart: bool,
+) -> Checkpoint:
+    """
+    Watermark every upload not yet covered by the checkpoint and record the results.
+
+    The next chunk of uploads is fetched while the current one is being watermarked.
+
+    Args:
+        watermark_settings (WatermarkSettings): The watermark to apply.
+        checkpoint_path (str): Where progress is recorded and resumed from.
+        chunk_size (int): Uploads fetched, watermarked and recorded per step.
+        workers (int): Size of the process pool.
+        restart (bool): Ignore an existing checkpoint and start a new run.
+
+    Returns:
+        Checkpoint: The final checkpoint.
+    """
+    checkpoint = load_checkpoint(checkpoint_path, watermark_settings, restart)
+    try:
+        resolved = await resolve_watermark_image(watermark_settings, None)
+    except WatermarkImageNotFound as e:
+        raise SystemExit(str(e))
+    remaining = await prisma.models.Upload.prisma().count(
+        where={"id": {"gt": checkpoint.last_id}} if checkpoint.last_id else None
+    )
+    progress = Progress(
+        checkpoint.processed, checkpoint.processed + remaining, checkpoint.failed
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(
+        f"{checkpoint_path}.failed", "a"
+    ) as failures:
+        uploads = await _fetch_chunk(checkpoint.last_id, chunk_size)
+        while uploads:
+            next_uploads = asyncio.create_task(_fetch_chunk(uploads[-1].id, chunk_size))
+            failed_before = progress.failed
+            try:
+                settings_rows, watermarked_rows = await _process_chunk(
+                    uploads, checkpoint, resolved, pool, progress, failures
+                )
+            except BaseException:
+                next_uploads.cancel()
+                raise
+            if settings_rows:
+                await prisma.models.WatermarkSetting.prisma().create_many(
+                    data=settings_rows, skip_duplicates=True
+                )
+                await prisma.models.WatermarkedPDF.prisma().create_many(
+                    data=watermarked_rows, skip_duplicates=True
+                )
+            failures.flush()
+            checkpoint = checkpoint.copy(
+                update={
+                    "last_id": uploads[-1].id,
+                    "processed": checkpoint.processed + len(uploads),
+                    "failed": checkpoint.failed + progress.failed - failed_before,
+                }
+            )
+            save_checkpoint(checkpoint_path, checkpoint)
+            uploads = await next_uploads
+    progress.show(end="\n")
+    return checkpoint
+
+
+async def _run(args: argparse.Namespace) -> Checkpoint:
+    db_client = Prisma(auto_register=True)
+    await db_client.connect()
+    try:
+        return await backfill(
+            WatermarkSettings.parse_file(args.settings),
+            args.checkpoint,
+            args.chunk_size,
+            args.workers,
+            args.restart,
+        )
+    finally:
+        await db_client.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("settings", help="JSON file with the watermark settings to apply")
+    parser.add_argument("--checkpoint", default="backfill.checkpoint.json")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=WORKER_PROCESSES)
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore an existing checkpoint"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        checkpoint = asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        sys.exit("\nInterrupted; run the same command again to resume.")
+    print(f"Done: {checkpoint.processed:,} uploads, {checkpoint.failed:,} failed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import prisma
 import prisma.models
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
+from project.storage import remove_upload_files
+
 
 class DeleteDocumentResponse(BaseModel):
     """
@@ -18,6 +21,7 @@ async def delete_user_document(id: str) -> DeleteDocumentResponse:
 
     This function handles the deletion of user's document by its unique identifier. It also ensures that
     all related watermarked PDFs generated from this document are removed to maintain data consistency.
+    The stored file, its page index, watermarked copies, thumbnails and cached previews are removed from disk as well.
 
     Args:
         id (str): The unique identifier for the document to be deleted.
@@ -36,6 +40,7 @@ async def delete_user_document(id: str) -> DeleteDocumentResponse:
         where={"originalUploadId": id}
     )
     await prisma.models.Upload.prisma().delete(where={"id": id})
+    await run_in_threadpool(remove_upload_files, document.path)
     return DeleteDocumentResponse(
         success=True, message="Document and related data successfully deleted."
     )
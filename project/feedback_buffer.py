@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_BUFFER_SIZE = int(os.getenv("FEEDBACK_BUFFER_SIZE", "1000"))
+
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "1.0"))
+
+FEEDBACK_SUBMIT_TIMEOUT = 0.5
+
+FLUSH_ATTEMPTS = 3
+
+
+class FeedbackBufferFull(Exception):
+    """
+    Raised when feedback cannot be buffered because the buffer stayed full.
+    """
+
+
+class BufferedFeedback(BaseModel):
+    """
+    A feedback entry waiting to be written.
+    """
+
+    userId: Optional[str]
+    content: str
+
+
+class FeedbackBuffer:
+    """
+    Write-behind buffer for feedback.
+
+    Submissions are queued in memory and written by a single background task with one
+    create_many call per batch. A batch is written once it holds `batch_size` entries or
+    `flush_interval` seconds after its first entry, whichever comes first. When the buffer
+    is full, submitters wait up to FEEDBACK_SUBMIT_TIMEOUT for room before being rejected.
+
+    A batch that still fails after FLUSH_ATTEMPTS is split in halves, recursively, so one bad
+    entry, such as one whose user was deleted meanwhile, costs only itself. A single entry
+    that fails is stored without its user before it is given up.
+    """
+
+    def __init__(self, capacity: int, batch_size: int, flush_interval: float):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.capacity)
+            self._task = asyncio.create_task(self._run())
+        return self._queue
+
+    async def submit(self, user_id: Optional[str], content: str) -> None:
+        """
+        Queue a feedback entry for writing.
+
+        Args:
+            user_id (Optional[str]): ID of the user submitting the feedback.
+            content (str): The feedback itself.
+
+        Raises:
+            FeedbackBufferFull: If no room became available in time, or the buffer is shutting down.
+        """
+        if self._closed:
+            raise FeedbackBufferFull("Feedback buffer is shutting down")
+        queue = self._ensure_started()
+        entry = BufferedFeedback(userId=user_id, content=content)
+        try:
+            await asyncio.wait_for(queue.put(entry), FEEDBACK_SUBMIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise FeedbackBufferFull("Feedback buffer is full")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    entry = await asyncio.wait_for(
+                        self._queue.get(), deadline - loop.time()
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+        remaining = []
+        while not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is not None:
+                remaining.append(entry)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start : start + self.batch_size])
+
+    async def _write(self, batch: List[BufferedFeedback]) -> Optional[Exception]:
+        try:
+            await prisma.models.Feedback.prisma().create_many(
+                data=[entry.dict() for entry in batch]
+            )
+        except Exception as e:
+            return e
+        return None
+
+    async def _flush(self, batch: List[BufferedFeedback]) -> None:
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            error = await self._write(batch)
+            if error is None:
+                return
+            logger.error(
+                "Failed to write %d feedback entries (attempt %d)",
+                len(batch),
+                attempt,
+                exc_info=error,
+            )
+            if attempt < FLUSH_ATTEMPTS:
+                await asyncio.sleep(0.1 * 2**attempt)
+        await self._flush_split(batch)
+
+    async def _flush_split(self, batch: List[BufferedFeedback]) -> None:
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            for half in (batch[:middle], batch[middle:]):
+                if await self._write(half) is not None:
+                    await self._flush_split(half)
+            return
+        entry = batch[0]
+        if entry.userId is not None:
+            anonymous = entry.copy(update={"userId": None})
+            if await self._write([anonymous]) is None:
+                logger.warning(
+                    "Stored feedback of unknown user %s without its user", entry.userId
+                )
+                return
+        logger.error("Dropped feedback entry from user %s", entry.userId)
+
+    def pending(self) -> int:
+        """
+        Number of entries waiting in the buffer.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def stop(self) -> None:
+        """
+        Stop accepting feedback and write everything still buffered. Called on shutdown.
+        """
+        self._closed = True
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+
+
+feedback_buffer = FeedbackBuffer(
+    FEEDBACK_BUFFER_SIZE, FEEDBACK_BATCH_SIZE, FEEDBACK_FLUSH_INTERVAL
+)
@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+
+from project.preview_cache import PreviewCacheMetrics, preview_cache
+from project.rate_limit import RateLimitMetrics, rate_limiter
+from project.scheduler import SchedulerMetrics, scheduler
+from project.user_cache import UserCacheMetrics, user_cache
+
+
+class MetricsResponse(BaseModel):
+    """
+    Operational metrics of this instance: rate limiting, watermark job scheduling, user caching and preview caching.
+    """
+
+    rate_limit: RateLimitMetrics
+    scheduler: SchedulerMetrics
+    user_cache: UserCacheMetrics
+    preview_cache: PreviewCacheMetrics
+
+
+async def get_metrics() -> MetricsResponse:
+    """
+    Report the current state of the rate limiter, the fair-share scheduler and the user and preview caches.
+
+    Args:
+
+    Returns:
+    MetricsResponse: Admission counters, queue depths and wait-time statistics per priority, and cache hit rates.
+    """
+    return MetricsResponse(
+        rate_limit=rate_limiter.metrics(),
+        scheduler=scheduler.metrics(),
+        user_cache=user_cache.metrics(),
+        preview_cache=preview_cache.metrics(),
+    )
@@ -0,0 +1,33 @@
+from typing import List
+
+from fastapi import HTTPException
+
+from project.profiling import ProfileReport, ProfileSummary, profile_store
+
+
+async def list_profiles() -> List[ProfileSummary]:
+    """
+    List the stored profiles of watermarking jobs, slowest first.
+
+    Args:
+
+    Returns:
+    List[ProfileSummary]: ID, job, document and wall time of each stored profile.
+    """
+    return profile_store.slowest()
+
+
+async def get_profile(profile_id: str) -> ProfileReport:
+    """
+    Fetch one stored profile.
+
+    Args:
+    profile_id (str): ID of the profile.
+
+    Returns:
+    ProfileReport: Collapsed call stacks, per-page timings and allocation statistics.
+    """
+    report = profile_store.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return report
@@ -1,7 +1,7 @@
-import prisma
-import prisma.models
 from pydantic import BaseModel
 
+from project.user_cache import user_cache
+
 
 class UserProfileResponse(BaseModel):
     """
@@ -17,7 +17,7 @@ async def get_user_profile() -> UserProfileResponse:
     """
     Retrieve the profile information of the authenticated user.
 
-    This function queries the prisma.models.User table in the database to fetch the profile information of the authenticated user.
+    This function reads the authenticated user's record through the user cache, falling back to the prisma.models.User table.
     It omits sensitive information for security reasons and returns only the ID, email, and role of the user.
 
     Returns:
@@ -29,7 +29,7 @@ async def get_user_profile() -> UserProfileResponse:
         > {"id": "123", "email": "user@example.com", "role": "USER"}
     """
     user_id = "simulated-authenticated-user-id"
-    user = await prisma.models.User.prisma().find_unique(where={"id": user_id})
+    user = await user_cache.get_by_id(user_id)
     if user:
         return UserProfileResponse(id=user.id, email=user.email, role=user.role)
     else:
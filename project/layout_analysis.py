@@ -0,0 +1,285 @@
+import math
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from project.page_index import (
+    Grid,
+    PackedGrid,
+    PageIndex,
+    PageInfo,
+    pack_grid,
+    page_index_lock,
+    save_page_index,
+    stored_page_index,
+)
+from project.profiling import page_span
+from project.workers import pdfium_lock
+
+if TYPE_CHECKING:
+    import pypdfium2 as pdfium
+
+GRID_SIZE = 24
+
+LAYOUT_CHUNK_PAGES = 8
+
+_PREFERRED_FRACTIONS = (
+    (1.0, 0.0),
+    (0.5, 0.0),
+    (0.0, 0.0),
+    (1.0, 1.0),
+    (0.5, 1.0),
+    (0.0, 1.0),
+    (1.0, 0.5),
+    (0.0, 0.5),
+    (0.5, 0.5),
+)
+
+
+def _user_to_view(info: PageInfo, x: float, y: float) -> Tuple[float, float]:
+    """
+    Map a point from the page's user space onto the page as displayed, applying /Rotate.
+    """
+    x0, y0, x1, y1 = info.crop_box
+    u, v = x - x0, y - y0
+    rotation = info.rotation % 360
+    if rotation == 90:
+        return v, (x1 - x0) - u
+    if rotation == 180:
+        return (x1 - x0) - u, (y1 - y0) - v
+    if rotation == 270:
+        return (y1 - y0) - v, u
+    return u, v
+
+
+def _occupancy(page: "pdfium.PdfPage", info: PageInfo) -> Grid:
+    """
+    Fraction of each grid cell covered by text, images or forms, rows bottom to top as displayed.
+    """
+    import pypdfium2.raw as pdfium_c
+
+    content_objects = (
+        pdfium_c.FPDF_PAGEOBJ_TEXT,
+        pdfium_c.FPDF_PAGEOBJ_IMAGE,
+        pdfium_c.FPDF_PAGEOBJ_FORM,
+    )
+    cell_w, cell_h = info.width / GRID_SIZE, info.height / GRID_SIZE
+    grid = [[0.0] * GRID_SIZE for _ in range(GRID_SIZE)]
+    for obj in page.get_objects(filter=content_objects, max_depth=0):
+        left, bottom, right, top = obj.get_pos()
+        xs, ys = zip(
+            _user_to_view(info, left, bottom), _user_to_view(info, right, top)
+        )
+        bx0, bx1 = max(min(xs), 0.0), min(max(xs), info.width)
+        by0, by1 = max(min(ys), 0.0), min(max(ys), info.height)
+        if bx1 <= bx0 or by1 <= by0:
+            continue
+        for row in range(int(by0 // cell_h), min(math.ceil(by1 / cell_h), GRID_SIZE)):
+            dy = min(by1, (row + 1) * cell_h) - max(by0, row * cell_h)
+            for col in range(
+                int(bx0 // cell_w), min(math.ceil(bx1 / cell_w), GRID_SIZE)
+            ):
+                dx = min(bx1, (col + 1) * cell_w) - max(bx0, col * cell_w)
+                grid[row][col] += dx * dy / (cell_w * cell_h)
+    return [[min(value, 1.0) for value in row] for row in grid]
+
+
+def analyse_pages(path: str, pages: Sequence[PageInfo]) -> List[PackedGrid]:
+    """
+    Compute the content occupancy grid of some pages of a PDF, opening it only once.
+
+    Args:
+        path (str): Path of the PDF document.
+        pages (Sequence[PageInfo]): Index entries of the pages to analyse.
+
+    Returns:
+        List[PackedGrid]: One packed occupancy grid per page, in the order given.
+    """
+    import pypdfium2 as pdfium
+
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            grids = []
+            for info in pages:
+                with page_span("layout", info.number):
+                    grids.append(pack_grid(_occupancy(pdf[info.number], info)))
+            return grids
+        finally:
+            pdf.close()
+
+
+def layout_chunks(
+    upload_path: str, index: PageIndex, numbers: Optional[Sequence[int]] = None
+) -> Tuple[PageIndex, List[List[PageInfo]]]:
+    """
+    Find the pages still lacking a layout analysis, in chunks sized for one analyse_pages call.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+        index (PageIndex): Current page index of the upload.
+        numbers (Optional[Sequence[int]]): Pages wanted; all pages if omitted.
+
+    Returns:
+        Tuple[PageIndex, List[List[PageInfo]]]: The latest stored index, and the chunks of
+            pages to analyse.
+    """
+    index = stored_page_index(upload_path) or index
+    wanted = range(index.page_count) if numbers is None else numbers
+    missing = [index.pages[n] for n in wanted if index.pages[n].occupancy is None]
+    chunks = [
+        missing[i : i + LAYOUT_CHUNK_PAGES]
+        for i in range(0, len(missing), LAYOUT_CHUNK_PAGES)
+    ]
+    return index, chunks
+
+
+def store_layout(
+    upload_path: str, index: PageIndex, grids: Dict[int, PackedGrid]
+) -> PageIndex:
+    """
+    Write newly computed occupancy grids into the stored page index.
+
+    The grids are merged into the stored index under the index lock, so concurrent jobs
+    analysing different pages of the same upload keep each other's results.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+        index (PageIndex): Page index to fall back on if none is stored.
+        grids (Dict[int, PackedGrid]): Packed occupancy grids keyed by page number.
+
+    Returns:
+        PageIndex: The stored index, including the new grids.
+    """
+    if not grids:
+        return index
+    with page_index_lock(upload_path):
+        stored = stored_page_index(upload_path) or index
+        pages = [
+            info.copy(update={"occupancy": grids[info.number]})
+            if info.occupancy is None and info.number in grids
+            else info
+            for info in stored.pages
+        ]
+        index = stored.copy(update={"pages": pages})
+        save_page_index(upload_path, index)
+    return index
+
+
+def ensure_layout(
+    upload_path: str, index: PageIndex, numbers: Optional[Sequence[int]] = None
+) -> PageIndex:
+    """
+    Make sure the page index holds the layout analysis of the given pages, computing only what is missing.
+
+    Newly analysed pages are written back to the index sidecar, so each page is analysed at most
+    once per upload no matter how often it is watermarked or previewed. The pages are analysed
+    in the calling thread: call this from a worker process, as pdfium is not thread-safe and
+    server threads would queue on the pdfium lock. Services spread large documents over the
+    worker processes with layout_chunks and store_layout instead.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+        index (PageIndex): Current page index of the upload.
+        numbers (Optional[Sequence[int]]): Pages to analyse; all pages if omitted.
+
+    Returns:
+        PageIndex: The index with occupancy grids for the requested pages.
+    """
+    index, chunks = layout_chunks(upload_path, index, numbers)
+    grids = {}
+    for chunk in chunks:
+        for info, grid in zip(chunk, analyse_pages(upload_path, chunk)):
+            grids[info.number] = grid
+    return store_layout(upload_path, index, grids)
+
+
+def _summed_area(grid: Grid) -> List[List[float]]:
+    size = len(grid)
+    table = [[0.0] * (size + 1) for _ in range(size + 1)]
+    for row in range(size):
+        running = 0.0
+        for col in range(size):
+            running += grid[row][col]
+            table[row + 1][col + 1] = table[row][col + 1] + running
+    return table
+
+
+def _integral(table: List[List[float]], x: float, y: float) -> float:
+    """
+    Occupancy summed over [0, x] x [0, y], in cell units. The summed-area table is bilinear
+    inside each cell, so interpolating it is exact for fractional positions.
+    """
+    size = len(table) - 1
+    x, y = min(max(x, 0.0), size), min(max(y, 0.0), size)
+    col, row = min(int(x), size - 1), min(int(y), size - 1)
+    dx, dy = x - col, y - row
+    return (
+        table[row][col] * (1 - dx) * (1 - dy)
+        + table[row][col + 1] * dx * (1 - dy)
+        + table[row + 1][col] * (1 - dx) * dy
+        + table[row + 1][col + 1] * dx * dy
+    )
+
+
+def emptiest_center(
+    info: PageInfo,
+    half_x: float,
+    half_y: float,
+    margin_x: float,
+    margin_y: float,
+) -> Tuple[float, float]:
+    """
+    Choose where to centre a watermark so it covers as little page content as possible.
+
+    The nine anchor positions are tried first, margins before the centre. Other positions
+    inside the margins are only searched when no anchor is empty, and only chosen if they
+    are strictly emptier.
+
+    Args:
+        info (PageInfo): Index entry of the page, with its occupancy grid.
+        half_x (float): Half the width of the watermark's rotated bounding box.
+        half_y (float): Half the height of the watermark's rotated bounding box.
+        margin_x (float): Horizontal page margin, in points.
+        margin_y (float): Vertical page margin, in points.
+
+    Returns:
+        Tuple[float, float]: Centre of the watermark on the page as displayed.
+    """
+    grid = info.grid
+    table = _summed_area(grid)
+    size = len(grid)
+    scale_x, scale_y = size / info.width, size / info.height
+    low_x, high_x = margin_x + half_x, info.width - margin_x - half_x
+    low_y, high_y = margin_y + half_y, info.height - margin_y - half_y
+    if high_x < low_x:
+        low_x = high_x = info.width / 2
+    if high_y < low_y:
+        low_y = high_y = info.height / 2
+
+    def covered(cx: float, cy: float) -> float:
+        x0, x1 = (cx - half_x) * scale_x, (cx + half_x) * scale_x
+        y0, y1 = (cy - half_y) * scale_y, (cy + half_y) * scale_y
+        return (
+            _integral(table, x1, y1)
+            - _integral(table, x0, y1)
+            - _integral(table, x1, y0)
+            + _integral(table, x0, y0)
+        )
+
+    best, best_score = None, math.inf
+    for fx, fy in _PREFERRED_FRACTIONS:
+        center = (low_x + fx * (high_x - low_x), low_y + fy * (high_y - low_y))
+        score = covered(*center)
+        if score < best_score - 1e-6:
+            best, best_score = center, score
+    if best_score <= 1e-6:
+        return best
+    steps_x = max(int((high_x - low_x) * scale_x), 1)
+    steps_y = max(int((high_y - low_y) * scale_y), 1)
+    for i in range(steps_x + 1):
+        cx = low_x + (high_x - low_x) * i / steps_x
+        for j in range(steps_y + 1):
+            cy = low_y + (high_y - low_y) * j / steps_y
+            score = covered(cx, cy)
+            if score < best_score - 1e-6:
+                best, best_score = (cx, cy), score
+    return best
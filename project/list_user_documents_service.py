@@ -1,9 +1,12 @@
-from typing import List
+from typing import Dict, List, Optional
 
 import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.page_index import stored_page_index
+from project.thumbnails import thumbnail_urls
+
 
 class DocumentDetail(BaseModel):
     """
@@ -16,6 +19,8 @@ class DocumentDetail(BaseModel):
     fileSize: int
     createdAt: str
     path: str
+    pageCount: Optional[int] = None
+    thumbnails: Dict[int, str] = {}
 
 
 class ListUserDocumentsResponse(BaseModel):
@@ -26,10 +31,21 @@ class ListUserDocumentsResponse(BaseModel):
     documents: List[DocumentDetail]
 
 
+def _page_count(upload_path: str) -> Optional[int]:
+    """
+    Page count recorded in the upload's page index, or None if the upload has not been indexed.
+    """
+    index = stored_page_index(upload_path)
+    return index.page_count if index else None
+
+
 async def list_user_documents() -> ListUserDocumentsResponse:
     """
     Lists all documents uploaded by the user.
 
+    The response is assembled with `construct()`: every field comes straight from the
+    database or the upload's sidecar files, so validating it would only cost time.
+
     Args:
 
 
@@ -38,14 +54,16 @@ async def list_user_documents() -> ListUserDocumentsResponse:
     """
     uploads = await prisma.models.Upload.prisma().find_many()
     documents = [
-        DocumentDetail(
+        DocumentDetail.construct(
             id=upload.id,
             fileName=upload.fileName,
             fileType=upload.fileType,
             fileSize=upload.fileSize,
             createdAt=str(upload.createdAt),
             path=upload.path,
+            pageCount=_page_count(upload.path),
+            thumbnails=thumbnail_urls(upload.path),
         )
         for upload in uploads
     ]
-    return ListUserDocumentsResponse(documents=documents)
+    return ListUserDocumentsResponse.construct(documents=documents)
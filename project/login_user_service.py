@@ -1,8 +1,9 @@
 import bcrypt
-import prisma
-import prisma.models
 from pydantic import BaseModel
 
+from project.sessions import issue_session_token
+from project.user_cache import user_cache
+
 
 class UserInfo(BaseModel):
     """
@@ -37,11 +38,11 @@ async def login_user(email: str, password: str) -> UserLoginResponse:
     Raises:
     Exception: With message "Incorrect email or password" if authentication fails.
     """
-    user = await prisma.models.User.prisma().find_unique(where={"email": email})
+    user = await user_cache.get_by_email(email)
     if user and bcrypt.checkpw(
         password.encode("utf-8"), user.hashedPassword.encode("utf-8")
     ):
-        session_token = "fake_session_token_for_demo_purpose"
+        session_token = issue_session_token(user.id, user.sessionGeneration)
         user_info = UserInfo(
             user_id=user.id, user_email=user.email, user_role=user.role
         )
@@ -1,5 +1,10 @@
+import prisma
+import prisma.models
 from pydantic import BaseModel
 
+from project.sessions import verify_session_token
+from project.user_cache import user_cache
+
 
 class LogoutUserResponse(BaseModel):
     """
@@ -13,11 +18,11 @@ async def logout_user(session_token: str) -> LogoutUserResponse:
     """
     Logout the user and terminate the session.
 
-    This function assumes the existence of a mechanism to handle session tokens,
-    such as a field in the User model or separate session management. Since the
-    current schema does not specify a Session model, this function will illustrate
-    a logical approach to terminating a user session based on the session_token
-    without direct database interaction for session management.
+    Session tokens are signed rather than stored, so a session is revoked by bumping the
+    user's sessionGeneration: every token issued before the bump stops verifying. This
+    ends all of the user's sessions, on every device. The bump only applies if the token's
+    generation is still current, so repeating a logout is harmless. Other workers see it
+    once their cached user is invalidated through the user cache's channel.
 
     Args:
         session_token (str): The token identifying the user's current session to be terminated.
@@ -28,13 +33,14 @@ async def logout_user(session_token: str) -> LogoutUserResponse:
     Example:
         logout_user('example_session_token')
         > {'message': 'Session successfully terminated.'}
-
-    Note: This function does not interact with a database due to the absence of a
-    Session model in the provided schema. Implementation of this function would
-    require either adding a Session model to the schema or managing sessions
-    directly through another mechanism (e.g., storing session tokens in the User model).
-
-    As such, this function returns a static response to fulfill the signature
-    requirements without performing actual session termination.
     """
+    claims = verify_session_token(session_token)
+    if claims is None:
+        return LogoutUserResponse(message="Session not found or already expired.")
+    user_id, generation = claims
+    await prisma.models.User.prisma().update_many(
+        where={"id": user_id, "sessionGeneration": generation},
+        data={"sessionGeneration": {"increment": 1}},
+    )
+    user_cache.invalidate(user_id=user_id)
     return LogoutUserResponse(message="Session successfully terminated.")
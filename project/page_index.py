@@ -0,0 +1,290 @@
+import base64
+import fcntl
+import hashlib
+import math
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, validator
+
+from project.storage import sidecar_path
+
+if TYPE_CHECKING:
+    from pypdf import PageObject, PdfReader
+
+INDEX_VERSION = 1
+
+_TEXT_OPERATOR = re.compile(rb"(?:^|\s)BT(?:\s|$)")
+
+_INHERITABLE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+Box = Tuple[float, float, float, float]
+
+Grid = List[List[float]]
+
+# A square Grid of values in [0, 1], one byte per cell in row order, base64-encoded.
+PackedGrid = str
+
+
+def pack_grid(grid: Grid) -> PackedGrid:
+    """
+    Store a grid compactly: each cell is rounded to 1/255, so a 24x24 grid takes 768
+    characters of JSON instead of several kilobytes of floats.
+    """
+    cells = bytes(
+        round(min(max(value, 0.0), 1.0) * 255) for row in grid for value in row
+    )
+    return base64.b64encode(cells).decode()
+
+
+def unpack_grid(packed: PackedGrid) -> Grid:
+    """
+    The grid stored by pack_grid.
+    """
+    cells = base64.b64decode(packed)
+    size = math.isqrt(len(cells))
+    return [
+        [cell / 255 for cell in cells[i : i + size]]
+        for i in range(0, len(cells), size)
+    ]
+
+
+class PageInfo(BaseModel):
+    """
+    Geometry and location of a single page, enough to place a watermark without parsing the PDF.
+    """
+
+    number: int
+    media_box: Box
+    crop_box: Box
+    rotation: int
+    object_number: int
+    generation: int
+    image_only: bool
+    occupancy: Optional[PackedGrid] = None
+
+    @validator("occupancy", pre=True)
+    def pack_occupancy(cls, value):
+        """
+        Accept plain grids too, as stored by indexes written before grids were packed.
+        """
+        return pack_grid(value) if isinstance(value, list) else value
+
+    @property
+    def grid(self) -> Optional[Grid]:
+        """
+        The page's occupancy grid, unpacked, or None if its layout was never analysed.
+        """
+        return None if self.occupancy is None else unpack_grid(self.occupancy)
+
+    @property
+    def width(self) -> float:
+        """
+        Width of the page as displayed, i.e. of the crop box after applying /Rotate.
+        """
+        x0, y0, x1, y1 = self.crop_box
+        return abs(y1 - y0) if self.rotation % 180 else abs(x1 - x0)
+
+    @property
+    def height(self) -> float:
+        """
+        Height of the page as displayed, i.e. of the crop box after applying /Rotate.
+        """
+        x0, y0, x1, y1 = self.crop_box
+        return abs(x1 - x0) if self.rotation % 180 else abs(y1 - y0)
+
+
+class PageIndex(BaseModel):
+    """
+    Compact per-upload index of the pages of a PDF, stored as a sidecar file next to the upload.
+    """
+
+    version: int = INDEX_VERSION
+    sha256: str
+    file_size: int
+    page_count: int
+    pages: List[PageInfo]
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_image_only(page: "PageObject") -> bool:
+    """
+    A page is image-only when it draws at least one image and has no text operators.
+    Pages using form XObjects are treated as having text, since forms may contain any content.
+    """
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    has_image = False
+    if xobjects:
+        for xobject in xobjects.get_object().values():
+            subtype = xobject.get_object().get("/Subtype")
+            if subtype == "/Form":
+                return False
+            has_image = has_image or subtype == "/Image"
+    if not has_image:
+        return False
+    contents = page.get_contents()
+    return not contents or not _TEXT_OPERATOR.search(contents.get_data())
+
+
+def _box(box) -> Box:
+    return (float(box.left), float(box.bottom), float(box.right), float(box.top))
+
+
+def build_page_index(path: str) -> PageIndex:
+    """
+    Parse a PDF once and collect the per-page information later watermarking steps need.
+
+    Args:
+        path (str): Path of the PDF document on disk.
+
+    Returns:
+        PageIndex: Page count, boxes, rotation, object location and content kind of every page.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    pages = []
+    for number, page in enumerate(reader.pages):
+        ref = page.indirect_reference
+        pages.append(
+            PageInfo(
+                number=number,
+                media_box=_box(page.mediabox),
+                crop_box=_box(page.cropbox),
+                rotation=page.rotation % 360,
+                object_number=ref.idnum,
+                generation=ref.generation,
+                image_only=_is_image_only(page),
+            )
+        )
+    return PageIndex(
+        sha256=_file_sha256(path),
+        file_size=os.path.getsize(path),
+        page_count=len(pages),
+        pages=pages,
+    )
+
+
+def save_page_index(upload_path: str, index: PageIndex) -> str:
+    """
+    Write the page index of an upload to its sidecar file.
+
+    Args:
+        upload_path (str): Path of the upload the index describes.
+        index (PageIndex): The index to store.
+
+    Returns:
+        str: Path of the written sidecar file.
+    """
+    index_path = sidecar_path(upload_path, "index.json")
+    tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(index.json())
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+@contextmanager
+def page_index_lock(upload_path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on an upload's page index, across processes, while it is read,
+    updated and saved.
+
+    The lock is an flock on a sidecar file, so it also covers instances sharing the upload
+    directory over NFS.
+
+    Args:
+        upload_path (str): Path of the upload whose index is updated.
+    """
+    with open(sidecar_path(upload_path, "index.lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+@lru_cache(maxsize=256)
+def _read_page_index(index_path: str, mtime_ns: int) -> PageIndex:
+    return PageIndex.parse_file(index_path)
+
+
+def stored_page_index(upload_path: str) -> Optional[PageIndex]:
+    """
+    Return the stored page index of an upload without ever parsing the PDF.
+
+    Indexes are cached in memory keyed by their sidecar's modification time, so repeated
+    reads of the same document's index do not touch the disk beyond a stat call.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+
+    Returns:
+        Optional[PageIndex]: The stored index, or None if the upload has not been indexed yet.
+    """
+    index_path = sidecar_path(upload_path, "index.json")
+    try:
+        mtime_ns = os.stat(index_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    index = _read_page_index(index_path, mtime_ns)
+    return index if index.version == INDEX_VERSION else None
+
+
+def load_page_index(upload_path: str) -> PageIndex:
+    """
+    Return the page index of an upload, building and storing it first if it is missing or outdated.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+
+    Returns:
+        PageIndex: The page index of the upload.
+    """
+    index = stored_page_index(upload_path)
+    if index is None:
+        index = build_page_index(upload_path)
+        save_page_index(upload_path, index)
+    return index
+
+
+def read_page(reader: "PdfReader", info: PageInfo) -> "PageObject":
+    """
+    Load a single page straight from the cross-reference table, without walking the page tree.
+
+    The reader still loads the cross-reference table when it is opened; only the page
+    tree walk and the page objects of other pages are skipped.
+
+    Inheritable attributes missing from the page dictionary are copied from its ancestors,
+    as walking the page tree would have done.
+
+    Args:
+        reader (PdfReader): Reader opened on the indexed PDF.
+        info (PageInfo): Index entry of the page to load.
+
+    Returns:
+        PageObject: The page, ready to be modified or added to a writer.
+    """
+    from pypdf import PageObject
+    from pypdf.generic import IndirectObject, NameObject
+
+    ref = IndirectObject(info.object_number, info.generation, reader)
+    page = PageObject(reader, ref)
+    page.update(ref.get_object())
+    parent = page.get("/Parent")
+    while parent is not None:
+        parent = parent.get_object()
+        for key in _INHERITABLE_KEYS:
+            if key not in page and key in parent:
+                page[NameObject(key)] = parent[key]
+        parent = parent.get("/Parent")
+    return page
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import Optional
+
+from fastapi import Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+from project.page_index import PageIndex
+from project.storage import PREVIEW_DIR, derived_path
+from project.watermark_engine import PreparedWatermark
+
+# Previews count against the instance's memory where the disk is in memory, as on Cloud Run.
+PREVIEW_CACHE_BYTES = int(os.getenv("PREVIEW_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+PREVIEW_DPI = 96
+
+PREVIEW_QUALITY = 85
+
+# Longest side of a preview image in pixels, whatever the page size and resolution.
+PREVIEW_MAX_SIDE = 2048
+
+# Part of every preview key; bump it when a change to rendering alters the images.
+PREVIEW_RENDER_VERSION = 1
+
+PREVIEW_URL_PREFIX = "/previews"
+
+# Previews are named after their content, so a URL never changes what it points to.
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_PREVIEW_NAME = re.compile(r"[0-9a-f-]+-([0-9a-f]{32})\.webp")
+
+
+def preview_key(
+    index: PageIndex, page: int, watermark: PreparedWatermark, dpi: int
+) -> str:
+    """
+    Cache key of a rendered preview: the upload's content hash, the page, the settings, the
+    rendered stamp's content hash, the resolution and the renderer's version.
+    """
+    settings_hash = hashlib.sha256(
+        watermark.settings.json(sort_keys=True).encode()
+    ).hexdigest()
+    key = (
+        f"{PREVIEW_RENDER_VERSION}:{index.sha256}:{page}:{settings_hash}:"
+        f"{watermark.stamp.sha256}:{dpi}:{PREVIEW_MAX_SIDE}:{PREVIEW_QUALITY}"
+    )
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def preview_path(upload_path: str, key: str) -> str:
+    """
+    Path of a cached preview, named after the upload so it is removed along with it.
+    """
+    return derived_path(PREVIEW_DIR, upload_path, f"{key}.webp")
+
+
+def preview_url(path: str) -> str:
+    """
+    URL a cached preview is served at.
+    """
+    return f"{PREVIEW_URL_PREFIX}/{os.path.basename(path)}"
+
+
+class PreviewCacheMetrics(BaseModel):
+    """
+    Counters of the rendered preview cache, for this process.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    bytes: int
+
+
+class PreviewCache:
+    """
+    Disk cache of rendered previews, shared by all workers, bounded to `max_bytes`.
+
+    Each process keeps a running estimate of the cache size. When it passes the bound, the
+    directory is scanned and the least recently used files, by modification time, are
+    removed until the cache is back under 90% of the bound. Hits refresh the modification
+    time.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, path: str) -> bool:
+        """
+        Whether a preview is cached, marking it as recently used if so.
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, path: str, image: bytes) -> None:
+        """
+        Add a rendered preview to the cache, evicting old previews if it grew too large.
+        """
+        os.makedirs(PREVIEW_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image)
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self._evict()
+        else:
+            self._size += len(image)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        with os.scandir(PREVIEW_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(".webp"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        if size > self.max_bytes:
+            entries.sort()
+            for _, file_size, path in entries:
+                if size <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+        self._size = size
+
+    def response(self, name: str, if_none_match: Optional[str]) -> Response:
+        """
+        Serve a cached preview with immutable caching headers and its key as ETag, marking it
+        as recently used.
+
+        Args:
+            name (str): File name from the preview URL.
+            if_none_match (Optional[str]): The request's If-None-Match header.
+
+        Returns:
+            Response: The image, 304 if the client's copy is current, or 404.
+        """
+        match = _PREVIEW_NAME.fullmatch(name)
+        if not match:
+            return Response(status_code=404)
+        headers = {"Cache-Control": PREVIEW_CACHE_CONTROL, "ETag": f'"{match[1]}"'}
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            if "*" in tags or headers["ETag"] in tags:
+                return Response(status_code=304, headers=headers)
+        path = os.path.join(PREVIEW_DIR, name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return Response(status_code=404)
+        return FileResponse(path, media_type="image/webp", headers=headers)
+
+    def metrics(self) -> PreviewCacheMetrics:
+        """
+        Current hit and eviction counters and the estimated cache size.
+        """
+        return PreviewCacheMetrics(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            bytes=self._size or 0,
+        )
+
+
+preview_cache = PreviewCache(PREVIEW_CACHE_BYTES)
@@ -1,19 +1,28 @@
+import asyncio
+from typing import Optional
+
 import prisma
-import prisma.enums
 import prisma.models
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-
-class WatermarkSettings(BaseModel):
-    """
-    Defines the customization options for the watermark to be applied such as type, opacity, position, scale, and rotation.
-    """
-
-    type: prisma.enums.WatermarkType
-    opacity: float
-    position: str
-    scale: float
-    rotation: float
+from project.layout_analysis import ensure_layout
+from project.page_index import PageIndex, load_page_index
+from project.preview_cache import (
+    PREVIEW_DPI,
+    PREVIEW_MAX_SIDE,
+    PREVIEW_QUALITY,
+    preview_cache,
+    preview_key,
+    preview_path,
+    preview_url,
+)
+from project.profiling import profile_store, run_profiled
+from project.scheduler import Priority, scheduler
+from project.watermark_engine import prepare_watermark, render_preview
+from project.watermark_images import WatermarkImageNotFound, resolve_watermark_image
+from project.watermark_settings import Anchor, WatermarkSettings
+from project.workers import get_process_pool
 
 
 class PreviewWatermarkResponse(BaseModel):
@@ -22,17 +31,56 @@ class PreviewWatermarkResponse(BaseModel):
     """
 
     preview_url: str
+    page_count: Optional[int] = None
+
+
+def render_page_preview(
+    upload_path: str,
+    index: PageIndex,
+    watermark_settings: WatermarkSettings,
+    page: int,
+    dpi: int,
+) -> bytes:
+    """
+    Render one page of an upload with the watermark applied, analysing its layout first if needed.
+    """
+    if watermark_settings.position is Anchor.AUTO:
+        index = ensure_layout(upload_path, index, [page])
+    watermark = prepare_watermark(watermark_settings)
+    return render_preview(
+        upload_path,
+        index.pages[page],
+        watermark,
+        dpi,
+        PREVIEW_QUALITY,
+        PREVIEW_MAX_SIDE,
+    )
 
 
 async def preview_watermark(
-    document_id: str, watermark_settings: WatermarkSettings
+    document_id: str,
+    watermark_settings: WatermarkSettings,
+    caller_id: str,
+    page: int = 0,
+    dpi: int = PREVIEW_DPI,
 ) -> PreviewWatermarkResponse:
     """
     Generate a preview of the watermarked document.
 
+    Page geometry comes from the upload's page index, so previewing never walks the page tree.
+    With automatic placement, the previewed page's layout is analysed once and kept in the index.
+    The rendered page is cached on disk under the upload's content hash, the page, the settings,
+    the rendered stamp and the resolution, so flipping back to a page or setting seen before
+    costs no rendering. Large pages are rendered at a lower resolution, up to PREVIEW_MAX_SIDE pixels.
+    Renders run on the worker processes, as pdfium is not thread-safe, and are interactive
+    jobs, scheduled ahead of bulk watermarking.
+
     Args:
     document_id (str): Identifier for the uploaded PDF document to be watermarked.
     watermark_settings (WatermarkSettings): The settings to be used for the watermark including type, opacity, position, scale, and rotation.
+    caller_id (str): The caller's user ID, or guest address, that the render is scheduled under.
+    page (int): Zero-based number of the page to preview.
+    dpi (int): Resolution of the preview image.
 
     Returns:
     PreviewWatermarkResponse: Provides a URL pointing to a preview of the watermarked document, enabling the user to review before final application.
@@ -40,5 +88,34 @@ async def preview_watermark(
     upload = await prisma.models.Upload.prisma().find_unique(where={"id": document_id})
     if not upload:
         return PreviewWatermarkResponse(preview_url="Document not found")
-    preview_url = f"https://preview.watermarkservice.com/{document_id}?opacity={watermark_settings.opacity}&position={watermark_settings.position}&scale={watermark_settings.scale}&rotation={watermark_settings.rotation}"
-    return PreviewWatermarkResponse(preview_url=preview_url)
+    try:
+        watermark_settings = await resolve_watermark_image(
+            watermark_settings, upload.userId
+        )
+    except WatermarkImageNotFound:
+        return PreviewWatermarkResponse(preview_url="Watermark image not found")
+    index = await run_in_threadpool(load_page_index, upload.path)
+    if not 0 <= page < index.page_count:
+        return PreviewWatermarkResponse(
+            preview_url="Page not found", page_count=index.page_count
+        )
+    watermark = await run_in_threadpool(prepare_watermark, watermark_settings)
+    path = preview_path(upload.path, preview_key(index, page, watermark, dpi))
+    if not await run_in_threadpool(preview_cache.lookup, path):
+        async with scheduler.slot(caller_id, Priority.INTERACTIVE):
+            image, profile = await asyncio.get_running_loop().run_in_executor(
+                get_process_pool(),
+                run_profiled,
+                profile_store.sample("preview", upload.id),
+                render_page_preview,
+                upload.path,
+                index,
+                watermark_settings,
+                page,
+                dpi,
+            )
+        profile_store.record(profile)
+        await run_in_threadpool(preview_cache.store, path, image)
+    return PreviewWatermarkResponse(
+        preview_url=preview_url(path), page_count=index.page_count
+    )
@@ -0,0 +1,104 @@
+import enum
+import os
+import tempfile
+
+import prisma
+import prisma.models
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from project.layout_analysis import ensure_layout
+from project.page_index import load_page_index
+from project.preview_cache import PREVIEW_DPI
+from project.preview_watermark_service import render_page_preview
+from project.profiling import (
+    ProfileOptions,
+    Profiler,
+    ProfileReport,
+    profile_store,
+    run_profiled,
+)
+from project.scheduler import Priority, scheduler
+from project.watermark_engine import prepare_watermark, watermark_pdf
+from project.watermark_images import WatermarkImageNotFound, resolve_watermark_image
+from project.watermark_settings import Anchor, WatermarkSettings
+
+
+class ProfileJob(str, enum.Enum):
+    """
+    The watermarking job to profile.
+    """
+
+    APPLY = "apply"
+    PREVIEW = "preview"
+
+
+def _apply_job(upload_path: str, watermark_settings: WatermarkSettings) -> None:
+    index = load_page_index(upload_path)
+    if watermark_settings.position is Anchor.AUTO:
+        index = ensure_layout(upload_path, index)
+    watermark = prepare_watermark(watermark_settings)
+    with tempfile.TemporaryDirectory() as directory:
+        watermark_pdf(upload_path, os.path.join(directory, "profile.pdf"), index, watermark)
+
+
+def _preview_job(upload_path: str, watermark_settings: WatermarkSettings, page: int) -> None:
+    index = load_page_index(upload_path)
+    if not 0 <= page < index.page_count:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Page {page} not found, the document has {index.page_count} pages.",
+        )
+    render_page_preview(upload_path, index, watermark_settings, page, PREVIEW_DPI)
+
+
+async def profile_watermark(
+    document_id: str,
+    watermark_settings: WatermarkSettings,
+    job: ProfileJob,
+    profiler: Profiler,
+    page: int = 0,
+    memory: bool = True,
+) -> ProfileReport:
+    """
+    Run one watermarking job on a document under a profiler and report where its time and memory went.
+
+    The job does the work of apply_watermark or preview_watermark, but entirely in this
+    process and thread so the profiler sees all of it: layout analysis does not fan out to
+    the worker processes, the watermarked file is written to a temporary directory, previews
+    are rendered even if cached and no rows are created. Stamps and page indexes are taken
+    from their caches as in production.
+    The report is also kept with the sampled production profiles.
+
+    Args:
+        document_id (str): The document to watermark.
+        watermark_settings (WatermarkSettings): The watermark to apply or preview.
+        job (ProfileJob): Whether to profile applying the watermark or previewing one page.
+        profiler (Profiler): cProfile, or the low-overhead sampling profiler.
+        page (int): Zero-based page to preview, for preview jobs.
+        memory (bool): Trace allocations with tracemalloc; slows the job down noticeably.
+
+    Returns:
+        ProfileReport: Collapsed call stacks, per-page timings and allocation statistics.
+    """
+    upload = await prisma.models.Upload.prisma().find_unique(where={"id": document_id})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    try:
+        watermark_settings = await resolve_watermark_image(
+            watermark_settings, upload.userId
+        )
+    except WatermarkImageNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    options = ProfileOptions(
+        job=job.value, document_id=document_id, profiler=profiler, memory=memory
+    )
+    if job is ProfileJob.APPLY:
+        priority, work = Priority.BULK, (_apply_job, upload.path, watermark_settings)
+    else:
+        priority = Priority.INTERACTIVE
+        work = (_preview_job, upload.path, watermark_settings, page)
+    async with scheduler.slot(upload.userId, priority):
+        _, report = await run_in_threadpool(run_profiled, options, *work)
+    profile_store.record(report)
+    return report
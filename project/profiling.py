@@ -0,0 +1,365 @@
+import cProfile
+import contextlib
+import enum
+import heapq
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+SAMPLING_INTERVAL = 0.005
+
+TOP_ALLOCATIONS = 15
+
+
+class Profiler(str, enum.Enum):
+    """
+    How a profiled job's call stacks are collected.
+
+    CPROFILE traces every call, which is exact but slows the job down; stacks are
+    reconstructed from its call graph. SAMPLING records the job's stack at a fixed
+    interval from another thread and costs little.
+    """
+
+    CPROFILE = "cprofile"
+    SAMPLING = "sampling"
+
+
+class ProfileOptions(BaseModel):
+    """
+    What to profile and how.
+    """
+
+    job: str
+    document_id: str
+    profiler: Profiler = Profiler.SAMPLING
+    memory: bool = False
+
+
+class PageTiming(BaseModel):
+    """
+    Time spent on one page in one stage of the pipeline, and, when memory is traced, the
+    memory it kept allocated and its allocation peak.
+    """
+
+    stage: str
+    page: int
+    ms: float
+    allocated_kb: Optional[float] = None
+    peak_kb: Optional[float] = None
+
+
+class Allocation(BaseModel):
+    """
+    Memory still allocated at the end of a job, grouped by the line that allocated it.
+    """
+
+    location: str
+    size_kb: float
+    count: int
+
+
+class MemoryStats(BaseModel):
+    """
+    Allocation statistics of a job, from tracemalloc.
+    """
+
+    peak_kb: float
+    top: List[Allocation]
+
+
+class ProfileSummary(BaseModel):
+    """
+    Identifies a stored profile.
+    """
+
+    id: str
+    job: str
+    document_id: str
+    profiler: Profiler
+    wall_ms: float
+
+
+class ProfileReport(ProfileSummary):
+    """
+    The profile of one job.
+
+    `collapsed` holds one line per distinct call stack, frames separated by semicolons and
+    followed by the stack's weight (microseconds for cProfile, samples for the sampler), the
+    input format of flamegraph.pl, speedscope and similar tools.
+    """
+
+    collapsed: str
+    pages: List[PageTiming]
+    memory: Optional[MemoryStats] = None
+
+
+def _label(filename: str, line: int, name: str) -> str:
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def _collapse_cprofile(profile: cProfile.Profile) -> Dict[str, int]:
+    # cProfile keeps a call graph, not stacks: each function's time is split between the
+    # paths leading to it in proportion to the time spent through each caller. Paths that
+    # account for less than a microsecond are dropped, which keeps the walk from exploding.
+    profile.create_stats()
+    stats = profile.stats
+    callees: Dict[tuple, List[tuple]] = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    stacks: Counter = Counter()
+
+    def walk(func: tuple, path: Tuple[str, ...], share: float) -> None:
+        own = int(stats[func][2] * share * 1e6)
+        if own:
+            stacks[";".join(path)] += own
+        for callee in callees.get(func, []):
+            label = _label(*callee)
+            total = stats[callee][3]
+            if label in path or not total:
+                continue
+            through = share * stats[callee][4][func][3]
+            if through >= 1e-6:
+                walk(callee, path + (label,), through / total)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, (_label(*func),), 1.0)
+    return stacks
+
+
+class _StackSampler:
+    """
+    Samples the stack of one thread from a background thread, from `stop_code` downwards.
+    """
+
+    def __init__(self, thread_id: int, stop_code, interval: float):
+        self.thread_id = thread_id
+        self.stop_code = stop_code
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            path = []
+            while frame is not None and frame.f_code is not self.stop_code:
+                code = frame.f_code
+                path.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if path:
+                self.stacks[";".join(reversed(path))] += 1
+
+    def __enter__(self) -> "_StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+class _PageSpan:
+    __slots__ = ("recorder", "stage", "number", "started", "memory")
+
+    def __init__(self, recorder: "_Recorder", stage: str, number: int):
+        self.recorder = recorder
+        self.stage = stage
+        self.number = number
+
+    def __enter__(self) -> None:
+        if self.recorder.memory:
+            tracemalloc.reset_peak()
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        timing = PageTiming(
+            stage=self.stage,
+            page=self.number,
+            ms=(time.perf_counter() - self.started) * 1000,
+        )
+        if self.recorder.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            timing.allocated_kb = (current - self.memory) / 1024
+            timing.peak_kb = (peak - self.memory) / 1024
+        self.recorder.pages.append(timing)
+
+
+class _Recorder:
+    def __init__(self, memory: bool):
+        self.memory = memory
+        self.pages: List[PageTiming] = []
+
+
+class _NullSpan:
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+_local = threading.local()
+
+# tracemalloc is process-wide, so only one memory-traced profile runs at a time.
+_memory_lock = threading.Lock()
+
+
+def page_span(stage: str, number: int):
+    """
+    Context manager timing the work on one page, when the current job is being profiled.
+
+    Args:
+        stage (str): Pipeline stage the work belongs to, e.g. "layout" or "stamp".
+        number (int): Zero-based page number.
+    """
+    recorder = getattr(_local, "recorder", None)
+    return _PageSpan(recorder, stage, number) if recorder else _NULL_SPAN
+
+
+def run_profiled(
+    options: Optional[ProfileOptions], fn: Callable, *args: Any
+) -> Tuple[Any, Optional[ProfileReport]]:
+    """
+    Call `fn(*args)`, profiling it as described by `options`.
+
+    Runs in whichever thread or process the job runs in, so it can be handed to an executor
+    in place of the job itself. Memory tracing is process-wide: memory-traced profiles in
+    one process wait for each other, and concurrent work in the same process is included
+    in the allocation figures.
+
+    Args:
+        options (Optional[ProfileOptions]): How to profile the call, or None to just call it.
+        fn (Callable): The job.
+        *args (Any): Arguments of the job.
+
+    Returns:
+        Tuple[Any, Optional[ProfileReport]]: The job's result and its profile, if profiled.
+    """
+    if options is None:
+        return fn(*args), None
+    with _memory_lock if options.memory else contextlib.nullcontext():
+        recorder = _Recorder(options.memory)
+        tracing = options.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        _local.recorder = recorder
+        started = time.perf_counter()
+        try:
+            if options.profiler is Profiler.CPROFILE:
+                profile = cProfile.Profile()
+                result = profile.runcall(fn, *args)
+                stacks = _collapse_cprofile(profile)
+            else:
+                with _StackSampler(
+                    threading.get_ident(), sys._getframe().f_code, SAMPLING_INTERVAL
+                ) as sampler:
+                    result = fn(*args)
+                stacks = sampler.stacks
+            wall = time.perf_counter() - started
+            memory = None
+            if options.memory:
+                snapshot = tracemalloc.take_snapshot()
+                memory = MemoryStats(
+                    peak_kb=tracemalloc.get_traced_memory()[1] / 1024,
+                    top=[
+                        Allocation(
+                            location=str(stat.traceback),
+                            size_kb=stat.size / 1024,
+                            count=stat.count,
+                        )
+                        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                    ],
+                )
+        finally:
+            _local.recorder = None
+            if tracing:
+                tracemalloc.stop()
+    report = ProfileReport(
+        id=uuid.uuid4().hex,
+        job=options.job,
+        document_id=options.document_id,
+        profiler=options.profiler,
+        wall_ms=wall * 1000,
+        collapsed="\n".join(f"{stack} {weight}" for stack, weight in stacks.items()),
+        pages=recorder.pages,
+        memory=memory,
+    )
+    return result, report
+
+
+class ProfileStore:
+    """
+    Opt-in profiling of production jobs: profiles about one job in `rate` with the sampling
+    profiler and keeps the `keep` slowest profiles in memory.
+    """
+
+    def __init__(self, rate: int, keep: int):
+        self.rate = rate
+        self.keep = keep
+        self._slowest: List[Tuple[float, str]] = []
+        self._reports: Dict[str, ProfileReport] = {}
+
+    def sample(self, job: str, document_id: str) -> Optional[ProfileOptions]:
+        """
+        Decide whether to profile a job.
+
+        Returns:
+            Optional[ProfileOptions]: Options to pass to run_profiled, or None to run the job unprofiled.
+        """
+        if self.rate <= 0 or random.randrange(self.rate):
+            return None
+        return ProfileOptions(job=job, document_id=document_id)
+
+    def record(self, report: Optional[ProfileReport]) -> None:
+        """
+        Keep a profile if it is among the slowest seen. Accepts None for unprofiled jobs.
+        """
+        if report is None:
+            return
+        entry = (report.wall_ms, report.id)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif entry > self._slowest[0]:
+            _, dropped = heapq.heapreplace(self._slowest, entry)
+            del self._reports[dropped]
+        else:
+            return
+        self._reports[report.id] = report
+
+    def slowest(self) -> List[ProfileSummary]:
+        """
+        The stored profiles, slowest first.
+        """
+        return [
+            ProfileSummary(
+                **self._reports[report_id].dict(include=set(ProfileSummary.__fields__))
+            )
+            for _, report_id in sorted(self._slowest, reverse=True)
+        ]
+
+    def get(self, report_id: str) -> Optional[ProfileReport]:
+        """
+        A stored profile by ID.
+        """
+        return self._reports.get(report_id)
+
+
+profile_store = ProfileStore(PROFILE_SAMPLE_RATE, PROFILE_KEEP)
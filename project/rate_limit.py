@@ -0,0 +1,208 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import prisma
+import prisma.enums
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+from project.sessions import session_user_id
+from project.user_cache import user_cache
+
+MAX_TRACKED_USERS = 10000
+
+# Reverse proxies in front of the app that append to X-Forwarded-For; 1 on Cloud Run.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+
+class RateLimit(BaseModel):
+    """
+    A token bucket configuration: tokens refilled per second and the bucket's capacity.
+    """
+
+    rate: float
+    burst: float
+
+
+USER_LIMITS: Dict[prisma.enums.Role, RateLimit] = {
+    prisma.enums.Role.ADMIN: RateLimit(rate=20, burst=60),
+    prisma.enums.Role.USER: RateLimit(rate=5, burst=20),
+    prisma.enums.Role.GUEST: RateLimit(rate=1, burst=5),
+}
+
+# Shared by everyone behind one address, so looser than a single user's limit.
+ADDRESS_LIMIT = RateLimit(rate=50, burst=150)
+
+ROLE_LIMITS: Dict[prisma.enums.Role, RateLimit] = {
+    prisma.enums.Role.ADMIN: RateLimit(rate=200, burst=600),
+    prisma.enums.Role.USER: RateLimit(rate=100, burst=300),
+    prisma.enums.Role.GUEST: RateLimit(rate=10, burst=30),
+}
+
+
+class TokenBucket:
+    """
+    Classic token bucket, refilled lazily whenever it is consulted.
+    """
+
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.tokens = limit.burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """
+        Take tokens from the bucket if enough are available.
+
+        Args:
+            cost (float): Number of tokens the request consumes.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until they will be available.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate
+        )
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.limit.rate
+
+    def refund(self, cost: float) -> None:
+        """
+        Return tokens taken for a request that was rejected by another limit.
+        """
+        self.tokens = min(self.limit.burst, self.tokens + cost)
+
+
+class RateLimitMetrics(BaseModel):
+    """
+    Counters of requests admitted and rejected by the rate limiter.
+    """
+
+    admitted: int
+    rejected: int
+    tracked_users: int
+
+
+class RateLimiter:
+    """
+    Token buckets per client address, per user sized by the user's role, and shared per role.
+
+    Every request is charged to its address first, before anything is looked up, so floods
+    from one address are turned away without touching the user cache or the database.
+    Requests with a verified session are then charged to their user and role; anonymous
+    requests are limited as guests, per address.
+    """
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._roles = {role: TokenBucket(limit) for role, limit in ROLE_LIMITS.items()}
+        self.admitted = 0
+        self.rejected = 0
+
+    def _bucket(self, key: str, limit: RateLimit) -> TokenBucket:
+        # A user's bucket is rebuilt when their role, and so their limit, changes.
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.limit != limit:
+            bucket = TokenBucket(limit)
+            self._buckets[key] = bucket
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > MAX_TRACKED_USERS:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    async def _role(self, user_id: Optional[str]) -> prisma.enums.Role:
+        # The role is read through the user cache on every request, so a role change
+        # takes effect as soon as the cached user is invalidated or expires.
+        user = await user_cache.get_by_id(user_id) if user_id else None
+        return user.role if user else prisma.enums.Role.GUEST
+
+    async def check(self, address: str, user_id: Optional[str], cost: float) -> None:
+        """
+        Admit a request or reject it with HTTP 429 and a Retry-After header.
+
+        Args:
+            address (str): Client address of the request.
+            user_id (Optional[str]): Verified ID of the calling user, or None for anonymous requests.
+            cost (float): Number of tokens the request consumes.
+
+        Raises:
+            HTTPException: 429 when the address's, the user's or the role's bucket is empty.
+        """
+        wait = self._bucket(f"addr:{address}", ADDRESS_LIMIT).take(cost)
+        if not wait:
+            role = await self._role(user_id)
+            key = f"user:{user_id}" if user_id else f"guest:{address}"
+            bucket = self._bucket(key, USER_LIMITS[role])
+            wait = bucket.take(cost)
+            if not wait:
+                wait = self._roles[role].take(cost)
+                if wait:
+                    bucket.refund(cost)
+        if wait:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded, please retry later.",
+                headers={"Retry-After": str(max(int(wait + 0.999), 1))},
+            )
+        self.admitted += 1
+
+    def metrics(self) -> RateLimitMetrics:
+        """
+        Current admission counters.
+        """
+        return RateLimitMetrics(
+            admitted=self.admitted,
+            rejected=self.rejected,
+            tracked_users=len(self._buckets),
+        )
+
+
+rate_limiter = RateLimiter()
+
+
+def client_address(request: Request) -> str:
+    """
+    Address of the client that sent a request.
+
+    Behind TRUSTED_PROXY_HOPS reverse proxies, the connection comes from the nearest proxy
+    and the client is the entry that many hops from the end of X-Forwarded-For; entries
+    further left are supplied by the client and ignored.
+    """
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [
+            hop.strip()
+            for hop in request.headers.get("X-Forwarded-For", "").split(",")
+            if hop.strip()
+        ]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(cost: float = 1.0) -> Callable:
+    """
+    Build a route dependency that charges each request against the caller's rate limits.
+
+    Callers are identified by their session token (`Authorization: Bearer`), checked
+    through the user cache; requests without a valid token are limited as guests.
+
+    Args:
+        cost (float): Number of tokens each request to the route consumes.
+
+    Returns:
+        Callable: The dependency, to be used with fastapi.Depends.
+    """
+
+    async def dependency(request: Request) -> None:
+        await rate_limiter.check(
+            client_address(request), await session_user_id(request), cost
+        )
+
+    return dependency
@@ -5,6 +5,8 @@ import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.user_cache import user_cache
+
 
 class RegisterUserResponse(BaseModel):
     """
@@ -36,6 +38,7 @@ async def register_user(
         user = await prisma.models.User.prisma().create(
             data={"email": email, "hashedPassword": ""}
         )
+        user_cache.invalidate(user_id=user.id, email=email)
         return RegisterUserResponse(
             user_id=user.id,
             email=email,
@@ -47,6 +50,7 @@ async def register_user(
         user = await prisma.models.User.prisma().create(
             data={"email": email, "hashedPassword": hashed_password.decode("utf-8")}
         )
+        user_cache.invalidate(user_id=user.id, email=email)
         return RegisterUserResponse(
             user_id=user.id,
             email=email,
@@ -0,0 +1,61 @@
+import logging
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    JSON response rendered with orjson. Unlike FastAPI's ORJSONResponse, non-string keys
+    (such as the thumbnail sizes in document listings) are allowed.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> FastJSONResponse:
+    """
+    Serialise a response model directly, skipping the route's response_model validation.
+
+    Only for models built from trusted data, typically with `.construct()`.
+    """
+    return FastJSONResponse(model.dict(), status_code=status_code)
+
+
+class ErrorResponseMiddleware:
+    """
+    Turns unhandled exceptions into a 500 response with an `{"error": ...}` JSON body.
+
+    HTTP errors raised on purpose (HTTPException, request validation) are handled further in
+    and never reach this middleware. Exceptions raised after the response has started, such
+    as in background tasks, are logged and re-raised.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            logger.exception("Error processing request")
+            if started:
+                raise
+            response = FastJSONResponse({"error": str(e)}, status_code=500)
+            await response(scope, receive, send)
@@ -0,0 +1,152 @@
+import asyncio
+import enum
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List
+
+from pydantic import BaseModel
+
+from project.workers import WORKER_PROCESSES
+
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", "0")) or WORKER_PROCESSES
+
+WAIT_SAMPLES = 1000
+
+
+class Priority(enum.IntEnum):
+    """
+    Scheduling class of a job. Lower values are always served first.
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class QueueMetrics(BaseModel):
+    """
+    Queue depth and wait times of one priority class.
+    """
+
+    queued: int
+    waiting_users: int
+    granted: int
+    wait_p50_ms: float
+    wait_p95_ms: float
+    wait_max_ms: float
+
+
+class SchedulerMetrics(BaseModel):
+    """
+    Snapshot of the fair-share scheduler's state.
+    """
+
+    slots: int
+    running: int
+    queues: Dict[str, QueueMetrics]
+
+
+class _Queue:
+    def __init__(self):
+        self.users: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.granted = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.wait_max = 0.0
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+class FairShareScheduler:
+    """
+    Grants a fixed number of execution slots to CPU-bound jobs.
+
+    Waiting jobs are grouped by priority, then by user. Interactive jobs always go before
+    bulk jobs, and within a priority, users are served round-robin. A user with thousands
+    of queued jobs therefore delays every other user by at most one job per turn.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.running = 0
+        self._queues = {priority: _Queue() for priority in Priority}
+
+    def _dispatch(self) -> None:
+        for priority in Priority:
+            queue = self._queues[priority]
+            while self.running < self.slots and queue.users:
+                user_id, waiters = next(iter(queue.users.items()))
+                future = waiters.popleft()
+                if waiters:
+                    queue.users.move_to_end(user_id)
+                else:
+                    del queue.users[user_id]
+                if future.done():
+                    continue
+                self.running += 1
+                future.set_result(time.monotonic())
+            if self.running >= self.slots:
+                return
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: Priority) -> AsyncIterator[None]:
+        """
+        Wait for an execution slot and hold it for the duration of the block.
+
+        Args:
+            user_id (str): The user the work is done for; fairness is enforced between users.
+            priority (Priority): Whether the job is interactive or bulk work.
+        """
+        queue = self._queues[priority]
+        future = asyncio.get_running_loop().create_future()
+        queue.users.setdefault(user_id, deque()).append(future)
+        enqueued = time.monotonic()
+        self._dispatch()
+        try:
+            granted = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                waiters = queue.users.get(user_id)
+                if waiters is not None and future in waiters:
+                    waiters.remove(future)
+                    if not waiters:
+                        del queue.users[user_id]
+            raise
+        wait = granted - enqueued
+        queue.granted += 1
+        queue.waits.append(wait)
+        queue.wait_max = max(queue.wait_max, wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def metrics(self) -> SchedulerMetrics:
+        """
+        Current queue depths and wait-time statistics, per priority.
+        """
+        queues = {}
+        for priority, queue in self._queues.items():
+            waits = sorted(queue.waits)
+            queues[priority.name.lower()] = QueueMetrics(
+                queued=sum(len(waiters) for waiters in queue.users.values()),
+                waiting_users=len(queue.users),
+                granted=queue.granted,
+                wait_p50_ms=_percentile(waits, 0.5) * 1000,
+                wait_p95_ms=_percentile(waits, 0.95) * 1000,
+                wait_max_ms=queue.wait_max * 1000,
+            )
+        return SchedulerMetrics(slots=self.slots, running=self.running, queues=queues)
+
+
+scheduler = FairShareScheduler(SCHEDULER_SLOTS)
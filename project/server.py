@@ -1,85 +1,93 @@
-import logging
+import os
 from contextlib import asynccontextmanager
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import prisma
 import prisma.enums
+import project.access
 import project.apply_watermark_service
 import project.delete_user_document_service
+import project.feedback_buffer
+import project.get_metrics_service
+import project.get_profiles_service
 import project.get_resources_service
 import project.get_user_profile_service
 import project.list_user_documents_service
 import project.login_user_service
 import project.logout_user_service
+import project.preview_cache
 import project.preview_watermark_service
+import project.profile_watermark_service
+import project.profiling
+import project.rate_limit
 import project.register_user_service
+import project.responses
+import project.storage
 import project.submit_feedback_service
+import project.thumbnails
 import project.update_user_profile_service
 import project.upload_document_service
-from fastapi import FastAPI, UploadFile
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
+import project.user_cache
+import project.warmup
+import project.watermark_settings
+import project.workers
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, Query, Response, UploadFile
+from fastapi.responses import PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 from prisma import Prisma
 
-logger = logging.getLogger(__name__)
-
 db_client = Prisma(auto_register=True)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await db_client.connect()
+    os.makedirs(project.storage.THUMBNAIL_DIR, exist_ok=True)
+    await project.warmup.start_up(db_client.connect())
+    await project.user_cache.user_cache.channel.start()
     yield
+    await project.feedback_buffer.feedback_buffer.stop()
+    await project.user_cache.user_cache.channel.stop()
     await db_client.disconnect()
+    project.workers.shutdown_process_pool()
 
 
 app = FastAPI(
     title="watermark-test",
-    lifespan=lifespan,
+    default_response_class=project.responses.FastJSONResponse,
     description="The task involves creating a solution that allows users to add text or image watermarks to PDF files. This solution must offer flexibility and control over the watermark's customization, including its opacity, position, and size, ensuring that the watermark does not obscure the content of the PDF. From the user's perspective, both text and image watermarks are essential for different use cases, with text watermarks being favored for their simplicity in certain contexts, and image watermarks being critical for branding purposes.\n\nThe envisioned interface for this solution includes a web-based platform where users can upload the PDF and the watermark file (whether text or image) through a user-friendly mechanism such as a drag-and-drop area or a file upload button. The platform should support popular image formats for image watermarks and provide clear labeling of each upload section to avoid user confusion. To adjust the watermark settings, a side panel or modal window should allow users to modify parameters like opacity, position, scale, and rotation. A real-time preview feature is also highly desired for users to see the watermark's appearance on the PDF before the finalizing step.\n\nFor the implementation, using Python is recommended due to its robust libraries for PDF manipulation such as PyPDF2 and ReportLab. These libraries can handle the technical requirements needed for implementing the watermarking functionality effectively, including adjusting the opacity of elements, preserving the original document's quality, and ensuring compatibility across various PDF viewers. Best practices include using transparent overlays to maintain document usability, securing the watermarks against removal, and optimizing the performance for batch processing scenarios.\n\nThis solution requires careful consideration of copyright and privacy laws to ensure the practice of watermarking complies with legal standards. Finally, providing detailed customization options allows the tool to cater to a broad range of needs, from simple copyright assertion to complex branding strategies.",
 )
 
 
+# FastAPI 0.79 does not accept a lifespan argument, so install it on the router directly.
+app.router.lifespan_context = lifespan
+
+app.add_middleware(project.responses.ErrorResponseMiddleware)
+
+app.mount(
+    project.thumbnails.THUMBNAIL_URL_PREFIX,
+    StaticFiles(directory=project.storage.THUMBNAIL_DIR, check_dir=False),
+    name="thumbnails",
+)
+
+
 @app.get(
     "/user/profile", response_model=project.get_user_profile_service.UserProfileResponse
 )
-async def api_get_get_user_profile() -> project.get_user_profile_service.UserProfileResponse | Response:
+async def api_get_get_user_profile() -> project.get_user_profile_service.UserProfileResponse:
     """
     Retrieve the profile information of the authenticated user.
     """
-    try:
-        res = await project.get_user_profile_service.get_user_profile()
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.get_user_profile_service.get_user_profile()
 
 
 @app.post("/user/logout", response_model=project.logout_user_service.LogoutUserResponse)
 async def api_post_logout_user(
     session_token: str,
-) -> project.logout_user_service.LogoutUserResponse | Response:
+) -> project.logout_user_service.LogoutUserResponse:
     """
     Logout the user and terminate the session.
     """
-    try:
-        res = await project.logout_user_service.logout_user(session_token)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.logout_user_service.logout_user(session_token)
 
 
 @app.put(
@@ -92,133 +100,81 @@ async def api_put_update_user_profile(
     name: Optional[str],
     avatar_url: Optional[str],
     bio: Optional[str],
-) -> project.update_user_profile_service.UpdateUserProfileResponse | Response:
+) -> project.update_user_profile_service.UpdateUserProfileResponse:
     """
     Update the user's profile information.
     """
-    try:
-        res = await project.update_user_profile_service.update_user_profile(
-            email, password, name, avatar_url, bio
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.update_user_profile_service.update_user_profile(
+        email, password, name, avatar_url, bio
+    )
 
 
 @app.post("/user/login", response_model=project.login_user_service.UserLoginResponse)
 async def api_post_login_user(
     email: str, password: str
-) -> project.login_user_service.UserLoginResponse | Response:
+) -> project.login_user_service.UserLoginResponse:
     """
     Authenticate user and create a session.
     """
-    try:
-        res = await project.login_user_service.login_user(email, password)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.login_user_service.login_user(email, password)
 
 
 @app.get(
     "/watermark/preview",
     response_model=project.preview_watermark_service.PreviewWatermarkResponse,
+    dependencies=[Depends(project.rate_limit.rate_limit())],
 )
 async def api_get_preview_watermark(
     document_id: str,
-    watermark_settings: project.preview_watermark_service.WatermarkSettings,
-) -> project.preview_watermark_service.PreviewWatermarkResponse | Response:
+    watermark_settings: project.watermark_settings.WatermarkSettings,
+    page: int = 0,
+    dpi: int = Query(project.preview_cache.PREVIEW_DPI, ge=36, le=300),
+    caller_id: str = Depends(project.access.caller_id()),
+) -> project.preview_watermark_service.PreviewWatermarkResponse:
     """
     Generate a preview of the watermarked document.
     """
-    try:
-        res = await project.preview_watermark_service.preview_watermark(
-            document_id, watermark_settings
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.preview_watermark_service.preview_watermark(
+        document_id, watermark_settings, caller_id, page, dpi
+    )
+
+
+@app.get(project.preview_cache.PREVIEW_URL_PREFIX + "/{name}", response_class=Response)
+async def api_get_get_preview_image(
+    name: str, if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """
+    Serve a rendered preview image. Preview URLs are content-addressed, so responses are immutable.
+    """
+    return project.preview_cache.preview_cache.response(name, if_none_match)
 
 
 @app.get(
     "/resources/get", response_model=project.get_resources_service.GetResourcesResponse
 )
-async def api_get_get_resources() -> project.get_resources_service.GetResourcesResponse | Response:
+async def api_get_get_resources() -> project.get_resources_service.GetResourcesResponse:
     """
     Fetches support materials such as FAQs and tutorials for user access.
     """
-    try:
-        res = await project.get_resources_service.get_resources()
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.get_resources_service.get_resources()
 
 
 @app.post(
     "/watermark/apply",
     response_model=project.apply_watermark_service.ApplyWatermarkResponse,
+    dependencies=[Depends(project.rate_limit.rate_limit())],
 )
 async def api_post_apply_watermark(
     document_id: str,
-    watermark_type: prisma.enums.WatermarkType,
-    text_content: Optional[str],
-    image_file: Optional[str],
-    opacity: float,
-    position: str,
-    scale: float,
-    rotation: float,
-) -> project.apply_watermark_service.ApplyWatermarkResponse | Response:
+    watermark_settings: project.watermark_settings.WatermarkSettings,
+    caller_id: str = Depends(project.access.caller_id()),
+) -> project.apply_watermark_service.ApplyWatermarkResponse:
     """
     Apply the watermark to the selected PDF document.
     """
-    try:
-        res = project.apply_watermark_service.apply_watermark(
-            document_id,
-            watermark_type,
-            text_content,
-            image_file,
-            opacity,
-            position,
-            scale,
-            rotation,
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.apply_watermark_service.apply_watermark(
+        document_id, watermark_settings, caller_id
+    )
 
 
 @app.post(
@@ -227,68 +183,43 @@ async def api_post_apply_watermark(
 )
 async def api_post_submit_feedback(
     user_id: str, content: str
-) -> project.submit_feedback_service.SubmitFeedbackResponse | Response:
+) -> project.submit_feedback_service.SubmitFeedbackResponse:
     """
     Allows users to submit feedback directly from the platform.
     """
-    try:
-        res = await project.submit_feedback_service.submit_feedback(user_id, content)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.submit_feedback_service.submit_feedback(user_id, content)
 
 
 @app.post(
     "/document/upload",
     response_model=project.upload_document_service.UploadDocumentResponse,
+    dependencies=[Depends(project.rate_limit.rate_limit())],
 )
 async def api_post_upload_document(
-    file: UploadFile, metadata: Optional[Dict]
-) -> project.upload_document_service.UploadDocumentResponse | Response:
+    file: UploadFile,
+    metadata: Optional[Dict],
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(project.access.require_session()),
+) -> project.upload_document_service.UploadDocumentResponse:
     """
     Allows users to upload a PDF document for watermarking.
     """
-    try:
-        res = await project.upload_document_service.upload_document(file, metadata)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.upload_document_service.upload_document(
+        file, metadata, user_id, background_tasks
+    )
 
 
 @app.get(
     "/document/list",
     response_model=project.list_user_documents_service.ListUserDocumentsResponse,
 )
-async def api_get_list_user_documents() -> project.list_user_documents_service.ListUserDocumentsResponse | Response:
+async def api_get_list_user_documents() -> project.responses.FastJSONResponse:
     """
     Lists all documents uploaded by the user.
     """
-    try:
-        res = await project.list_user_documents_service.list_user_documents()
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    # Built with construct() from database rows, so skip re-validating it as the response_model.
+    res = await project.list_user_documents_service.list_user_documents()
+    return project.responses.model_response(res)
 
 
 @app.delete(
@@ -297,22 +228,19 @@ async def api_get_list_user_documents() -> project.list_user_documents_service.L
 )
 async def api_delete_delete_user_document(
     id: str,
-) -> project.delete_user_document_service.DeleteDocumentResponse | Response:
+) -> project.delete_user_document_service.DeleteDocumentResponse:
     """
     Allows a user to delete a specific document.
     """
-    try:
-        res = await project.delete_user_document_service.delete_user_document(id)
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.delete_user_document_service.delete_user_document(id)
+
+
+@app.get("/metrics", response_model=project.get_metrics_service.MetricsResponse)
+async def api_get_get_metrics() -> project.get_metrics_service.MetricsResponse:
+    """
+    Report rate limiting and watermark scheduling metrics.
+    """
+    return await project.get_metrics_service.get_metrics()
 
 
 @app.post(
@@ -320,21 +248,68 @@ async def api_delete_delete_user_document(
 )
 async def api_post_register_user(
     email: Optional[str], password: Optional[str], oauth_token: Optional[str]
-) -> project.register_user_service.RegisterUserResponse | Response:
+) -> project.register_user_service.RegisterUserResponse:
     """
     Register a new user with email and password or OAuth.
     """
-    try:
-        res = await project.register_user_service.register_user(
-            email, password, oauth_token
-        )
-        return res
-    except Exception as e:
-        logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+    return await project.register_user_service.register_user(
+        email, password, oauth_token
+    )
+
+
+@app.post(
+    "/admin/profile",
+    response_model=project.profiling.ProfileReport,
+    dependencies=[Depends(project.access.require_role(prisma.enums.Role.ADMIN))],
+)
+async def api_post_profile_watermark(
+    document_id: str,
+    watermark_settings: project.watermark_settings.WatermarkSettings,
+    job: project.profile_watermark_service.ProfileJob,
+    profiler: project.profiling.Profiler = project.profiling.Profiler.CPROFILE,
+    page: int = 0,
+    memory: bool = True,
+) -> project.profiling.ProfileReport:
+    """
+    Profile one watermarking job on a document. Admins only.
+    """
+    return await project.profile_watermark_service.profile_watermark(
+        document_id, watermark_settings, job, profiler, page, memory
+    )
+
+
+@app.get(
+    "/admin/profiles",
+    response_model=List[project.profiling.ProfileSummary],
+    dependencies=[Depends(project.access.require_role(prisma.enums.Role.ADMIN))],
+)
+async def api_get_list_profiles() -> List[project.profiling.ProfileSummary]:
+    """
+    List the stored profiles of watermarking jobs, slowest first. Admins only.
+    """
+    return await project.get_profiles_service.list_profiles()
+
+
+@app.get(
+    "/admin/profiles/{id}",
+    response_model=project.profiling.ProfileReport,
+    dependencies=[Depends(project.access.require_role(prisma.enums.Role.ADMIN))],
+)
+async def api_get_get_profile(id: str) -> project.profiling.ProfileReport:
+    """
+    Fetch one stored profile. Admins only.
+    """
+    return await project.get_profiles_service.get_profile(id)
+
+
+@app.get(
+    "/admin/profiles/{id}/collapsed",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(project.access.require_role(prisma.enums.Role.ADMIN))],
+)
+async def api_get_get_profile_collapsed(id: str) -> str:
+    """
+    The collapsed call stacks of a stored profile, for flamegraph.pl or speedscope. Admins only.
+    """
+    res = await project.get_profiles_service.get_profile(id)
+    return res.collapsed
@@ -0,0 +1,99 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+from project.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(24 * 60 * 60)))
+
+if SESSION_SECRET:
+    _secret = SESSION_SECRET.encode()
+else:
+    logger.warning(
+        "SESSION_SECRET is not set; sessions are signed with a per-process key and "
+        "end when the process restarts"
+    )
+    _secret = secrets.token_bytes(32)
+
+
+def _signature(payload: str) -> str:
+    return hmac.new(_secret, payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_session_token(user_id: str, generation: int) -> str:
+    """
+    Create a session token for a user who has just authenticated.
+
+    Tokens carry the user ID, the user's session generation and the expiry time, signed
+    with SESSION_SECRET. Logging out bumps the generation, which ends every session
+    issued before it.
+
+    Args:
+        user_id (str): ID of the authenticated user.
+        generation (int): The user's current sessionGeneration.
+
+    Returns:
+        str: The token, valid for SESSION_TTL seconds unless the user logs out.
+    """
+    payload = f"{user_id}.{generation}.{int(time.time()) + SESSION_TTL}"
+    return f"{payload}.{_signature(payload)}"
+
+
+def verify_session_token(token: str) -> Optional[Tuple[str, int]]:
+    """
+    Check a session token's signature and expiry, without a database lookup.
+
+    The token may still have been revoked since; session_user_id also checks that.
+
+    Args:
+        token (str): A token returned by issue_session_token.
+
+    Returns:
+        Optional[Tuple[str, int]]: The ID of the user the token was issued to and the
+            session generation it was issued in, or None if it is forged, malformed or
+            expired.
+    """
+    payload, _, signature = token.rpartition(".")
+    if not payload or not hmac.compare_digest(signature, _signature(payload)):
+        return None
+    user_id, _, rest = payload.partition(".")
+    generation, _, expires = rest.partition(".")
+    if not (user_id and generation.isdigit() and expires.isdigit()):
+        return None
+    if int(expires) < time.time():
+        return None
+    return user_id, int(generation)
+
+
+async def session_user_id(request: Request) -> Optional[str]:
+    """
+    ID of the user whose session token the request carries as `Authorization: Bearer <token>`.
+
+    The user's session generation is read through the user cache, so a logout on another
+    worker takes effect as soon as the cached user is invalidated.
+
+    Returns:
+        Optional[str]: The verified user ID, or None for anonymous requests and invalid
+            or revoked tokens.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    claims = verify_session_token(token.strip())
+    if claims is None:
+        return None
+    user_id, generation = claims
+    user = await user_cache.get_by_id(user_id)
+    if user is None or user.sessionGeneration != generation:
+        return None
+    return user_id
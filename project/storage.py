@@ -0,0 +1,78 @@
+import glob
+import os
+import uuid
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+THUMBNAIL_DIR = os.path.join(UPLOAD_DIR, "thumbnails")
+
+PREVIEW_DIR = os.path.join(UPLOAD_DIR, "previews")
+
+
+def new_upload_path(extension: str) -> str:
+    """
+    Reserve a unique path inside the upload directory for a newly stored file.
+
+    Args:
+        extension (str): File extension for the stored file, without the leading dot.
+
+    Returns:
+        str: The path the file should be written to. The directory is created if needed.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.{extension}")
+
+
+def sidecar_path(upload_path: str, suffix: str) -> str:
+    """
+    Path of a file derived from an upload and stored next to it, e.g. its page index.
+
+    Args:
+        upload_path (str): Path of the original upload.
+        suffix (str): Suffix identifying the derived file, such as 'index.json'.
+
+    Returns:
+        str: The sidecar path, sharing the upload's stem.
+
+    Example:
+        sidecar_path('uploads/1234.pdf', 'index.json')
+        > 'uploads/1234.index.json'
+    """
+    return f"{os.path.splitext(upload_path)[0]}.{suffix}"
+
+
+def derived_path(directory: str, upload_path: str, suffix: str) -> str:
+    """
+    Path of a file derived from an upload but kept in a separate directory, e.g. a thumbnail.
+
+    Args:
+        directory (str): Directory holding this kind of derived file.
+        upload_path (str): Path of the original upload.
+        suffix (str): Suffix identifying the derived file, such as '64.webp'.
+
+    Returns:
+        str: The derived file's path, named after the upload's stem.
+    """
+    stem = os.path.splitext(os.path.basename(upload_path))[0]
+    return os.path.join(directory, f"{stem}-{suffix}")
+
+
+def remove_upload_files(upload_path: str) -> None:
+    """
+    Delete an upload from disk together with its sidecars and derived files, including
+    its thumbnails and cached previews.
+
+    Args:
+        upload_path (str): Path of the upload to remove.
+    """
+    stem = os.path.splitext(upload_path)[0]
+    derived = [
+        path
+        for directory in (THUMBNAIL_DIR, PREVIEW_DIR)
+        for path in glob.glob(derived_path(glob.escape(directory), upload_path, "*"))
+    ]
+    for path in [upload_path, *glob.glob(f"{glob.escape(stem)}.*"), *derived]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,7 +1,8 @@
-import prisma
-import prisma.models
 from pydantic import BaseModel
 
+from project.feedback_buffer import FeedbackBufferFull, feedback_buffer
+from project.user_cache import user_cache
+
 
 class SubmitFeedbackResponse(BaseModel):
     """
@@ -16,6 +17,10 @@ async def submit_feedback(user_id: str, content: str) -> SubmitFeedbackResponse:
     """
     Allows users to submit feedback directly from the platform.
 
+    Feedback is queued in the write-behind buffer and stored in batches, so submitting does not
+    wait for the database. When the buffer is full the submission is rejected after a short wait.
+    Feedback naming a user that does not exist is stored without a user, so it cannot fail its batch.
+
     Args:
     user_id (str): The ID of the user submitting feedback. This should be extracted from the user's session or token rather than explicitly passed to ensure security.
     content (str): The content of the user's feedback.
@@ -23,13 +28,13 @@ async def submit_feedback(user_id: str, content: str) -> SubmitFeedbackResponse:
     Returns:
     SubmitFeedbackResponse: Response model for when a user successfully submits feedback.
     """
+    if user_id and await user_cache.get_by_id(user_id) is None:
+        user_id = None
     try:
-        await prisma.models.Feedback.prisma().create(
-            data={"userId": user_id, "content": content}
-        )
+        await feedback_buffer.submit(user_id, content)
         success = True
         message = "Feedback submitted successfully."
-    except Exception as e:
+    except FeedbackBufferFull:
         success = False
-        message = f"Failed to submit feedback: {str(e)}"
+        message = "Feedback cannot be accepted right now, please try again shortly."
     return SubmitFeedbackResponse(success=success, message=message)
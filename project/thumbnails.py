@@ -0,0 +1,73 @@
+import os
+from typing import Dict
+
+from project.storage import THUMBNAIL_DIR, derived_path
+from project.workers import pdfium_lock
+
+THUMBNAIL_SIZES = (64, 256, 1024)
+
+THUMBNAIL_URL_PREFIX = "/thumbnails"
+
+
+def thumbnail_path(upload_path: str, size: int) -> str:
+    """
+    Path of the first-page thumbnail of an upload at a given size.
+    """
+    return derived_path(THUMBNAIL_DIR, upload_path, f"{size}.webp")
+
+
+def generate_thumbnails(upload_path: str) -> Dict[int, str]:
+    """
+    Render the first page of an upload once and store it at every thumbnail size.
+
+    The page is rendered at the largest size and downscaled for the smaller ones. Files are
+    written largest size last and moved into place atomically, so once the largest exists
+    the whole set does.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+
+    Returns:
+        Dict[int, str]: Path of the thumbnail for each size, keyed by its longest side in pixels.
+    """
+    import pypdfium2 as pdfium
+    from PIL import Image
+
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(upload_path)
+        try:
+            page = pdf[0]
+            largest = max(THUMBNAIL_SIZES)
+            image = page.render(scale=largest / max(page.get_size())).to_pil()
+        finally:
+            pdf.close()
+    image = image.convert("RGB")
+    paths = {}
+    for size in sorted(THUMBNAIL_SIZES):
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        path = thumbnail_path(upload_path, size)
+        tmp_path = f"{path}.tmp"
+        thumbnail.save(tmp_path, format="WEBP", quality=80)
+        os.replace(tmp_path, path)
+        paths[size] = path
+    return paths
+
+
+def thumbnail_urls(upload_path: str) -> Dict[int, str]:
+    """
+    URLs of the stored thumbnails of an upload, or an empty dict while they are still being generated.
+
+    Args:
+        upload_path (str): Path of the uploaded PDF.
+
+    Returns:
+        Dict[int, str]: Static URL of the thumbnail for each size.
+    """
+    if not os.path.exists(thumbnail_path(upload_path, max(THUMBNAIL_SIZES))):
+        return {}
+    return {
+        size: f"{THUMBNAIL_URL_PREFIX}/{os.path.basename(thumbnail_path(upload_path, size))}"
+        for size in THUMBNAIL_SIZES
+    }
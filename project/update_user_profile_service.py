@@ -4,6 +4,8 @@ import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.user_cache import user_cache
+
 
 class UpdateUserProfileResponse(BaseModel):
     """
@@ -51,6 +53,7 @@ async def update_user_profile(
         updated_user = await prisma.models.User.prisma().update(
             where={"id": user_id}, data=update_data
         )
+        user_cache.invalidate(user_id=user_id, email=email)
         return UpdateUserProfileResponse(
             email=email,
             name=name,
@@ -1,8 +1,23 @@
+import asyncio
+import logging
+import os
 from typing import Dict, Optional
 
-from fastapi import UploadFile
+import prisma
+import prisma.enums
+import prisma.models
+from fastapi import BackgroundTasks, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
+from project.page_index import build_page_index, save_page_index
+from project.scheduler import Priority, scheduler
+from project.storage import new_upload_path
+from project.thumbnails import generate_thumbnails
+from project.workers import get_process_pool
+
+logger = logging.getLogger(__name__)
+
 
 class UploadDocumentResponse(BaseModel):
     """
@@ -14,8 +29,23 @@ class UploadDocumentResponse(BaseModel):
     upload_link: Optional[str] = None
 
 
+async def _generate_thumbnails(path: str, user_id: str) -> None:
+    """
+    Background stage run after an upload: render its thumbnails on the worker processes.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        async with scheduler.slot(user_id, Priority.BULK):
+            await loop.run_in_executor(get_process_pool(), generate_thumbnails, path)
+    except Exception:
+        logger.exception("Failed to generate thumbnails for %s", path)
+
+
 async def upload_document(
-    file: UploadFile, metadata: Optional[Dict]
+    file: UploadFile,
+    metadata: Optional[Dict],
+    user_id: str,
+    background_tasks: Optional[BackgroundTasks] = None,
 ) -> UploadDocumentResponse:
     """
     Allows users to upload a PDF document for watermarking.
@@ -25,9 +55,15 @@ async def upload_document(
     storage, it generates a unique document ID for the uploaded file and possibly a link to access the
     stored document. This process is essential for later retrieving and watermarking the document.
 
+    The PDF is parsed exactly once here to build its page index, which is stored next to the upload so
+    previews and watermarking never need to re-parse the page tree. Thumbnails of the first page are
+    rendered afterwards as a background task, once the response has been sent.
+
     Args:
         file (UploadFile): The PDF document to be uploaded by the user.
         metadata (Optional[Dict]): Optional JSON object for storing metadata about the document, like tags or categories for organization.
+        user_id (str): ID of the signed-in user uploading the document, taken from their session.
+        background_tasks (Optional[BackgroundTasks]): Tasks run after the response is sent; thumbnails are rendered inline when omitted.
 
     Returns:
         UploadDocumentResponse: This model provides details about the successfully uploaded document, including a reference ID and possibly the link to the stored document.
@@ -35,10 +71,36 @@ async def upload_document(
     Example:
         file = UploadFile(filename='document.pdf')
         metadata = {'category': 'confidential'}
-        response = await upload_document(file, metadata)
+        response = await upload_document(file, metadata, user_id)
         > UploadDocumentResponse(document_id='123456', message='Document uploaded successfully.', upload_link='http://example.com/document/123456')
     """
-    document_id = "unique_document_id"
+    content = await file.read()
+    if not content.startswith(b"%PDF-"):
+        raise Exception("Only PDF documents can be uploaded for watermarking")
+    path = new_upload_path("pdf")
+    with open(path, "wb") as f:
+        f.write(content)
+    try:
+        async with scheduler.slot(user_id, Priority.INTERACTIVE):
+            index = await run_in_threadpool(build_page_index, path)
+    except Exception:
+        os.remove(path)
+        raise Exception("The uploaded file is not a readable PDF document")
+    await run_in_threadpool(save_page_index, path, index)
+    upload = await prisma.models.Upload.prisma().create(
+        data={
+            "userId": user_id,
+            "fileName": file.filename,
+            "fileType": prisma.enums.FileType.PDF,
+            "fileSize": len(content),
+            "path": path,
+        }
+    )
+    if background_tasks is not None:
+        background_tasks.add_task(_generate_thumbnails, path, user_id)
+    else:
+        await _generate_thumbnails(path, user_id)
+    document_id = upload.id
     upload_link = f"http://yourstorage.com/documents/{document_id}"
     return UploadDocumentResponse(
         document_id=document_id,
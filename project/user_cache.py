@@ -0,0 +1,351 @@
+import abc
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# "local" keeps invalidations inside the process; "postgres" sends them to every worker
+# and instance using the database, over LISTEN/NOTIFY.
+USER_CACHE_CHANNEL = os.getenv("USER_CACHE_CHANNEL", "local")
+
+USER_CACHE_NOTIFY_CHANNEL = "user_cache_invalidation"
+
+# Connection string parameters understood by Prisma but not by asyncpg.
+_PRISMA_URL_PARAMETERS = {
+    "schema",
+    "connection_limit",
+    "connect_timeout",
+    "pool_timeout",
+    "socket_timeout",
+    "pgbouncer",
+    "statement_cache_size",
+}
+
+
+class UserInvalidation(BaseModel):
+    """
+    Notice that a user's cached record is stale, sent to the caches of other workers.
+    """
+
+    origin: str
+    user_id: Optional[str] = None
+    email: Optional[str] = None
+
+
+class InvalidationChannel(abc.ABC):
+    """
+    Broadcasts invalidations between the user caches of several workers.
+
+    Implementations deliver every published message to every subscriber, including the
+    publisher; caches ignore their own messages.
+    """
+
+    @abc.abstractmethod
+    def publish(self, message: UserInvalidation) -> None:
+        """
+        Send an invalidation to every subscriber. Must not block.
+        """
+
+    @abc.abstractmethod
+    def subscribe(self, callback: Callable[[UserInvalidation], None]) -> None:
+        """
+        Call `callback`, on the event loop, with every invalidation sent on the channel.
+        """
+
+    async def start(self) -> None:
+        """
+        Open the channel's connections, if it has any. Called once at startup.
+        """
+
+    async def stop(self) -> None:
+        """
+        Close the channel's connections, once messages already published are sent.
+        """
+
+
+class LocalInvalidationChannel(InvalidationChannel):
+    """
+    In-process stand-in for a cross-worker channel, delivering messages synchronously.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Callable[[UserInvalidation], None]] = []
+
+    def publish(self, message: UserInvalidation) -> None:
+        for callback in self._subscribers:
+            callback(message)
+
+    def subscribe(self, callback: Callable[[UserInvalidation], None]) -> None:
+        self._subscribers.append(callback)
+
+
+def _asyncpg_dsn(database_url: str) -> str:
+    parts = urlsplit(database_url)
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query)
+        if key not in _PRISMA_URL_PARAMETERS
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class PostgresInvalidationChannel(InvalidationChannel):
+    """
+    Channel between every worker and instance using one Postgres database, over
+    LISTEN/NOTIFY.
+
+    Each process holds one dedicated asyncpg connection, which it listens and publishes
+    on. Postgres drops notifications for listeners that are disconnected, so an
+    invalidation missed while the connection is down leaves a record stale for at most
+    the cache's TTL.
+    """
+
+    def __init__(self, database_url: str, channel: str = USER_CACHE_NOTIFY_CHANNEL):
+        self.dsn = _asyncpg_dsn(database_url)
+        self.channel = channel
+        self._subscribers: List[Callable[[UserInvalidation], None]] = []
+        self._connection: Any = None
+        self._lock = asyncio.Lock()
+        self._pending: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        import asyncpg
+
+        self._connection = await asyncpg.connect(self.dsn)
+        await self._connection.add_listener(self.channel, self._on_notification)
+
+    async def stop(self) -> None:
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def publish(self, message: UserInvalidation) -> None:
+        if self._connection is None or self._connection.is_closed():
+            logger.warning("User cache channel is not connected, invalidation not sent")
+            return
+        task = asyncio.get_running_loop().create_task(self._notify(message.json()))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _notify(self, payload: str) -> None:
+        # An asyncpg connection runs one query at a time.
+        async with self._lock:
+            try:
+                await self._connection.execute(
+                    "SELECT pg_notify($1, $2)", self.channel, payload
+                )
+            except Exception:
+                logger.exception("Failed to publish a user cache invalidation")
+
+    def subscribe(self, callback: Callable[[UserInvalidation], None]) -> None:
+        self._subscribers.append(callback)
+
+    def _on_notification(self, connection: Any, pid: int, channel: str, payload: str):
+        message = UserInvalidation.parse_raw(payload)
+        for callback in self._subscribers:
+            callback(message)
+
+
+class UserCacheMetrics(BaseModel):
+    """
+    Counters of the user cache.
+    """
+
+    hits: int
+    misses: int
+    hit_rate: float
+    invalidations: int
+    evictions: int
+    size: int
+
+
+class UserCache:
+    """
+    Read-through cache of User rows, keyed by id and by email.
+
+    Entries expire after `ttl` seconds and the least recently used entry is evicted once
+    more than `capacity` users are cached. Lookups of missing users are cached the same
+    way, so repeated lookups of an unknown ID or address do not reach the database;
+    invalidating the ID or address, as registration does, forgets the miss. A load that
+    overlaps an invalidation is returned but not stored, so a stale row read just before
+    an update cannot outlive it.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        capacity: int,
+        channel: Optional[InvalidationChannel] = None,
+    ):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.channel = channel
+        self.name = uuid.uuid4().hex
+        self._users: "OrderedDict[str, Tuple[float, prisma.models.User]]" = OrderedDict()
+        self._ids_by_email: Dict[str, str] = {}
+        self._missing: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        if channel is not None:
+            channel.subscribe(self._on_invalidation)
+
+    def _cached(self, user_id: Optional[str]) -> Optional[prisma.models.User]:
+        entry = self._users.get(user_id) if user_id else None
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires <= time.monotonic():
+            self._drop(user_id)
+            return None
+        self._users.move_to_end(user_id)
+        return user
+
+    def _store(self, user: prisma.models.User) -> None:
+        self._drop(user.id)
+        self._users[user.id] = (time.monotonic() + self.ttl, user)
+        self._ids_by_email[user.email] = user.id
+        while len(self._users) > self.capacity:
+            self._drop(next(iter(self._users)))
+            self.evictions += 1
+
+    def _drop(self, user_id: str) -> None:
+        entry = self._users.pop(user_id, None)
+        if entry is not None and self._ids_by_email.get(entry[1].email) == user_id:
+            del self._ids_by_email[entry[1].email]
+
+    def _known_missing(self, key: Tuple[str, str]) -> bool:
+        expires = self._missing.get(key)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._missing[key]
+            return False
+        self._missing.move_to_end(key)
+        self.hits += 1
+        return True
+
+    async def _load(self, field: str, value: str) -> Optional[prisma.models.User]:
+        self.misses += 1
+        generation = self._generation
+        user = await prisma.models.User.prisma().find_unique(where={field: value})
+        if generation == self._generation:
+            if user is not None:
+                self._store(user)
+            else:
+                self._missing[(field, value)] = time.monotonic() + self.ttl
+                while len(self._missing) > self.capacity:
+                    self._missing.popitem(last=False)
+                    self.evictions += 1
+        return user
+
+    async def get_by_id(self, user_id: str) -> Optional[prisma.models.User]:
+        """
+        Look a user up by ID, from the cache if possible.
+
+        Args:
+            user_id (str): ID of the user.
+
+        Returns:
+            Optional[prisma.models.User]: The user, or None if there is no such user.
+        """
+        user = self._cached(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+        if self._known_missing(("id", user_id)):
+            return None
+        return await self._load("id", user_id)
+
+    async def get_by_email(self, email: str) -> Optional[prisma.models.User]:
+        """
+        Look a user up by email address, from the cache if possible.
+
+        Args:
+            email (str): Email address of the user.
+
+        Returns:
+            Optional[prisma.models.User]: The user, or None if there is no such user.
+        """
+        user = self._cached(self._ids_by_email.get(email))
+        if user is not None:
+            self.hits += 1
+            return user
+        if self._known_missing(("email", email)):
+            return None
+        return await self._load("email", email)
+
+    def _invalidate(self, user_id: Optional[str], email: Optional[str]) -> None:
+        self._generation += 1
+        self.invalidations += 1
+        if email is not None:
+            self._missing.pop(("email", email), None)
+            if email in self._ids_by_email:
+                self._drop(self._ids_by_email[email])
+        if user_id is not None:
+            self._missing.pop(("id", user_id), None)
+            self._drop(user_id)
+
+    def invalidate(
+        self, user_id: Optional[str] = None, email: Optional[str] = None
+    ) -> None:
+        """
+        Drop a user's cached record here and, through the channel, in the other workers.
+
+        Call after any write to the user's row. Either key is enough; give both when an
+        email address changes so the old and the new address are both dropped.
+
+        Args:
+            user_id (Optional[str]): ID of the changed user.
+            email (Optional[str]): Email address of the changed user.
+        """
+        self._invalidate(user_id, email)
+        if self.channel is not None:
+            self.channel.publish(
+                UserInvalidation(origin=self.name, user_id=user_id, email=email)
+            )
+
+    def _on_invalidation(self, message: UserInvalidation) -> None:
+        if message.origin != self.name:
+            self._invalidate(message.user_id, message.email)
+
+    def metrics(self) -> UserCacheMetrics:
+        """
+        Current hit and miss counters.
+        """
+        lookups = self.hits + self.misses
+        return UserCacheMetrics(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            invalidations=self.invalidations,
+            evictions=self.evictions,
+            size=len(self._users),
+        )
+
+
+def _channel() -> InvalidationChannel:
+    if USER_CACHE_CHANNEL == "postgres":
+        return PostgresInvalidationChannel(os.environ["DATABASE_URL"])
+    return LocalInvalidationChannel()
+
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE, _channel())
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Dict
+
+import prisma
+import prisma.models
+from fastapi.concurrency import run_in_threadpool
+
+from project.watermark_engine import TEXT_FONT, TEXT_FONT_SIZE, render_stamp
+from project.watermark_images import image_digest
+from project.watermark_settings import WatermarkSettings
+from project.workers import WORKER_PROCESSES, get_process_pool
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP", "").lower() in ("1", "true", "yes")
+
+WARMUP_TEMPLATES = int(os.getenv("WARMUP_TEMPLATES", "20"))
+
+timings: Dict[str, float] = {}
+
+
+async def timed(phase: str, awaitable: Awaitable) -> None:
+    """
+    Await a startup phase and record how long it took in `timings`, in seconds.
+    """
+    started = time.perf_counter()
+    try:
+        await awaitable
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+
+def preload_libraries() -> None:
+    """
+    Import the PDF, font and imaging stacks and load the watermark font's metrics.
+    """
+    import pypdf  # noqa: F401
+    import pypdfium2  # noqa: F401
+    import pypdfium2.raw  # noqa: F401
+    from PIL import Image
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen import canvas  # noqa: F401
+
+    Image.init()
+    stringWidth("", TEXT_FONT, TEXT_FONT_SIZE)
+
+
+def _worker_ready(_: int) -> int:
+    preload_libraries()
+    return os.getpid()
+
+
+def prefork_workers() -> int:
+    """
+    Start every worker process now instead of on the first job.
+
+    Returns:
+        int: Number of distinct worker processes that answered.
+    """
+    pool = get_process_pool()
+    return len(set(pool.map(_worker_ready, range(WORKER_PROCESSES * 2))))
+
+
+def _warm_up_processes() -> None:
+    # Workers are forked after the libraries are loaded, so they inherit them.
+    preload_libraries()
+    prefork_workers()
+
+
+def _prime_stamp(template: prisma.models.WatermarkTemplate, opacity: float) -> None:
+    image_sha256 = image_digest(template.imagePath) if template.imagePath else None
+    render_stamp(
+        template.templateType,
+        template.content,
+        template.imagePath,
+        image_sha256,
+        opacity,
+    )
+
+
+async def prime_overlay_cache(limit: int) -> int:
+    """
+    Render the stamps of the most recently updated watermark templates into the stamp cache.
+
+    Templates carry no placement or opacity, so stamps are rendered at the default opacity.
+
+    Args:
+        limit (int): Maximum number of templates to render.
+
+    Returns:
+        int: Number of stamps rendered.
+    """
+    templates = await prisma.models.WatermarkTemplate.prisma().find_many(
+        order={"updatedAt": "desc"}, take=limit
+    )
+    opacity = WatermarkSettings.__fields__["opacity"].default
+    primed = 0
+    for template in templates:
+        try:
+            await run_in_threadpool(_prime_stamp, template, opacity)
+            primed += 1
+        except Exception:
+            logger.warning("Could not prime stamp for template %s", template.id)
+    return primed
+
+
+async def start_up(connect: Awaitable) -> None:
+    """
+    Connect to the database and, when WARMUP is enabled, warm the process up meanwhile.
+
+    Warm-up loads the PDF and imaging libraries, starts the worker processes and, once
+    the database is connected, renders the stamps of the most recently updated templates.
+    Each phase's duration is kept in `timings`.
+
+    Args:
+        connect (Awaitable): The database connection coroutine.
+    """
+    phases = [timed("db_connect", connect)]
+    if WARMUP_ENABLED:
+        phases.append(timed("warm_up_processes", run_in_threadpool(_warm_up_processes)))
+    await asyncio.gather(*phases)
+    if WARMUP_ENABLED:
+        await timed("prime_overlay_cache", prime_overlay_cache(WARMUP_TEMPLATES))
+    logger.info(
+        "Startup phases: %s",
+        ", ".join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in timings.items()),
+    )
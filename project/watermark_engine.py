@@ -0,0 +1,261 @@
+import hashlib
+import io
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+import prisma
+import prisma.enums
+from pydantic import BaseModel
+
+from project.layout_analysis import emptiest_center
+from project.page_index import PageIndex, PageInfo, read_page
+from project.profiling import page_span
+from project.watermark_settings import Anchor, WatermarkSettings
+from project.workers import pdfium_lock
+
+if TYPE_CHECKING:
+    from pypdf import PageObject, Transformation
+
+TEXT_FONT = "Helvetica"
+
+TEXT_FONT_SIZE = 48.0
+
+
+class Stamp(BaseModel):
+    """
+    A watermark rendered at its natural size as a one-page transparent PDF, with the PDF's SHA-256.
+    """
+
+    pdf: bytes
+    sha256: str
+    width: float
+    height: float
+
+
+@lru_cache(maxsize=64)
+def render_stamp(
+    watermark_type: prisma.enums.WatermarkType,
+    text_content: Optional[str],
+    image_file: Optional[str],
+    image_sha256: Optional[str],
+    opacity: float,
+) -> Stamp:
+    """
+    Render a watermark once, reusing the result for every placement of the same content.
+
+    Args:
+        watermark_type (prisma.enums.WatermarkType): Whether the watermark is text or an image.
+        text_content (Optional[str]): The text to draw for a text watermark.
+        image_file (Optional[str]): Path of the stored image to draw for an image watermark.
+        image_sha256 (Optional[str]): Content hash of the image, so a replaced image is rendered again.
+        opacity (float): Opacity of the watermark, from 0 to 1.
+
+    Returns:
+        Stamp: The rendered watermark, to be merged onto document pages.
+    """
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    if watermark_type == prisma.enums.WatermarkType.IMAGE:
+        # Read the file ourselves: ImageReader would also fetch URLs.
+        with open(image_file, "rb") as f:
+            image = ImageReader(io.BytesIO(f.read()))
+        width, height = image.getSize()
+        c = canvas.Canvas(buffer, pagesize=(width, height))
+        c.setFillAlpha(opacity)
+        c.drawImage(image, 0, 0, width, height, mask="auto")
+    else:
+        width = stringWidth(text_content, TEXT_FONT, TEXT_FONT_SIZE)
+        height = TEXT_FONT_SIZE * 1.2
+        c = canvas.Canvas(buffer, pagesize=(width, height))
+        c.setFillAlpha(opacity)
+        c.setFont(TEXT_FONT, TEXT_FONT_SIZE)
+        c.drawString(0, TEXT_FONT_SIZE * 0.25, text_content)
+    c.showPage()
+    c.save()
+    pdf = buffer.getvalue()
+    return Stamp(
+        pdf=pdf, sha256=hashlib.sha256(pdf).hexdigest(), width=width, height=height
+    )
+
+
+def _view_to_user(info: PageInfo) -> "Transformation":
+    """
+    Map coordinates on the page as displayed onto the page's own user space, undoing /Rotate.
+    """
+    from pypdf import Transformation
+
+    x0, y0, x1, y1 = info.crop_box
+    w, h = x1 - x0, y1 - y0
+    rotation = info.rotation % 360
+    if rotation == 90:
+        return Transformation((0, 1, -1, 0, x0 + w, y0))
+    if rotation == 180:
+        return Transformation((-1, 0, 0, -1, x0 + w, y0 + h))
+    if rotation == 270:
+        return Transformation((0, -1, 1, 0, x0, y0 + h))
+    return Transformation((1, 0, 0, 1, x0, y0))
+
+
+class PreparedWatermark:
+    """
+    A rendered watermark together with the page-independent part of its placement.
+
+    Everything that does not depend on the page is computed once here, so placing the
+    watermark on a page only adds a translation and the page's /Rotate correction.
+    """
+
+    def __init__(self, settings: WatermarkSettings, stamp: Stamp):
+        self.settings = settings
+        self.stamp = stamp
+        self.base = settings.base_transform(stamp.width, stamp.height)
+        self.half_x, self.half_y = settings.half_extents(stamp.width, stamp.height)
+
+    def stamp_page(self) -> "PageObject":
+        """
+        A fresh copy of the stamp page, so concurrent jobs never share pypdf objects.
+        """
+        from pypdf import PdfReader
+
+        return PdfReader(io.BytesIO(self.stamp.pdf)).pages[0]
+
+    def transform_for(self, info: PageInfo) -> "Transformation":
+        """
+        Compute where the watermark goes on a page, using only the page's index entry.
+
+        The watermark's rotated bounding box is aligned to the anchor inside the page
+        margins, shifted by the offsets, and kept upright as the page is displayed.
+        With the AUTO anchor, the page's cached occupancy grid decides the position;
+        pages that have not been analysed fall back to the centre.
+
+        Args:
+            info (PageInfo): Index entry of the page being watermarked.
+
+        Returns:
+            Transformation: The matrix that maps the stamp page onto the document page.
+        """
+        from pypdf import Transformation
+
+        settings = self.settings
+        margin_x = settings.unit.to_points(settings.margin, info.width)
+        margin_y = settings.unit.to_points(settings.margin, info.height)
+        if settings.position is Anchor.AUTO and info.occupancy is not None:
+            cx, cy = emptiest_center(
+                info, self.half_x, self.half_y, margin_x, margin_y
+            )
+        else:
+            fx, fy = settings.position.fractions
+            span_x = max(info.width - 2 * (margin_x + self.half_x), 0.0)
+            span_y = max(info.height - 2 * (margin_y + self.half_y), 0.0)
+            cx = (info.width - span_x) / 2 + fx * span_x
+            cy = (info.height - span_y) / 2 + fy * span_y
+        cx += settings.unit.to_points(settings.offset_x, info.width)
+        cy += settings.unit.to_points(settings.offset_y, info.height)
+        return Transformation(self.base).translate(cx, cy).transform(_view_to_user(info))
+
+
+@lru_cache(maxsize=64)
+def prepare_watermark(settings: WatermarkSettings) -> PreparedWatermark:
+    """
+    Prepare a watermark for placement, reusing the result for identical settings.
+
+    Args:
+        settings (WatermarkSettings): The watermark's content and appearance.
+
+    Returns:
+        PreparedWatermark: The rendered stamp and its precomputed base transform.
+    """
+    stamp = render_stamp(
+        settings.type,
+        settings.text_content,
+        settings.image_file,
+        settings.image_sha256,
+        settings.opacity,
+    )
+    return PreparedWatermark(settings, stamp)
+
+
+def watermark_pdf(
+    source_path: str,
+    output_path: str,
+    index: PageIndex,
+    watermark: PreparedWatermark,
+) -> int:
+    """
+    Merge the watermark onto every page of a PDF and write the result.
+
+    Pages are loaded through the page index, so the page tree is never walked and page
+    geometry is never recomputed.
+
+    Args:
+        source_path (str): Path of the original PDF.
+        output_path (str): Path the watermarked PDF is written to.
+        index (PageIndex): Page index of the original PDF.
+        watermark (PreparedWatermark): The watermark, as returned by prepare_watermark.
+
+    Returns:
+        int: Size of the written file in bytes.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    stamp = watermark.stamp_page()
+    reader = PdfReader(source_path)
+    writer = PdfWriter()
+    for info in index.pages:
+        with page_span("stamp", info.number):
+            page = read_page(reader, info)
+            page.merge_transformed_page(stamp, watermark.transform_for(info))
+            writer.add_page(page)
+    with open(output_path, "wb") as f:
+        writer.write(f)
+        return f.tell()
+
+
+def render_preview(
+    source_path: str,
+    info: PageInfo,
+    watermark: PreparedWatermark,
+    dpi: int,
+    quality: int,
+    max_side: int,
+) -> bytes:
+    """
+    Render one page with the watermark merged onto it, as a WebP image.
+
+    Large pages are rendered at a lower resolution than asked for, so that neither side of
+    the image exceeds `max_side` pixels whatever the page size.
+
+    Args:
+        source_path (str): Path of the original PDF.
+        info (PageInfo): Index entry of the page to render.
+        watermark (PreparedWatermark): The watermark, as returned by prepare_watermark.
+        dpi (int): Resolution of the image.
+        quality (int): WebP quality, 0 to 100.
+        max_side (int): Largest width or height of the image, in pixels.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    import pypdfium2 as pdfium
+    from pypdf import PdfReader, PdfWriter
+
+    with page_span("preview", info.number):
+        page = read_page(PdfReader(source_path), info)
+        page.merge_transformed_page(watermark.stamp_page(), watermark.transform_for(info))
+        writer = PdfWriter()
+        writer.add_page(page)
+        composited = io.BytesIO()
+        writer.write(composited)
+        with pdfium_lock:
+            pdf = pdfium.PdfDocument(composited.getvalue())
+            try:
+                rendered = pdf[0]
+                scale = min(dpi / 72, max_side / max(rendered.get_size()))
+                image = rendered.render(scale=scale).to_pil()
+            finally:
+                pdf.close()
+        encoded = io.BytesIO()
+        image.convert("RGB").save(encoded, format="WEBP", quality=quality)
+        return encoded.getvalue()
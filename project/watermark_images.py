@@ -0,0 +1,86 @@
+import hashlib
+import os
+import stat
+from functools import lru_cache
+from typing import Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+from fastapi.concurrency import run_in_threadpool
+
+from project.watermark_settings import WatermarkSettings
+
+
+class WatermarkImageNotFound(Exception):
+    """
+    Raised when an IMAGE watermark's template does not exist, belongs to another user or has no stored image.
+    """
+
+
+@lru_cache(maxsize=256)
+def _image_digest(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def image_digest(path: str) -> str:
+    """
+    Content hash of a stored watermark image, cached by the file's modification time.
+
+    Args:
+        path (str): Path of the image on local storage.
+
+    Returns:
+        str: Hex SHA-256 of the image file.
+
+    Raises:
+        WatermarkImageNotFound: If the path is not a regular file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise WatermarkImageNotFound(f"Watermark image {path} is missing") from e
+    if not stat.S_ISREG(st.st_mode):
+        raise WatermarkImageNotFound(f"Watermark image {path} is not a file")
+    return _image_digest(path, st.st_mtime_ns, st.st_size)
+
+
+async def resolve_watermark_image(
+    watermark_settings: WatermarkSettings, user_id: Optional[str]
+) -> WatermarkSettings:
+    """
+    Point an IMAGE watermark at the stored image of its template.
+
+    Clients name an image watermark by template ID only; the image's path comes from the
+    WatermarkTemplate row and its content hash from the file, so no client input is ever
+    opened as a path or URL and a replaced image is never served from a stale cache.
+
+    Args:
+        watermark_settings (WatermarkSettings): Settings as parsed from the request.
+        user_id (Optional[str]): Owner the template must belong to, or None to skip the check.
+
+    Returns:
+        WatermarkSettings: The settings with image_file and image_sha256 filled in, or unchanged for TEXT watermarks.
+
+    Raises:
+        WatermarkImageNotFound: If the template cannot be used.
+    """
+    if watermark_settings.type != prisma.enums.WatermarkType.IMAGE:
+        return watermark_settings
+    template = await prisma.models.WatermarkTemplate.prisma().find_unique(
+        where={"id": watermark_settings.image_template_id}
+    )
+    if (
+        template is None
+        or template.templateType != prisma.enums.WatermarkType.IMAGE
+        or not template.imagePath
+        or (user_id is not None and template.userId != user_id)
+    ):
+        raise WatermarkImageNotFound(
+            f"Image template {watermark_settings.image_template_id} not found"
+        )
+    digest = await run_in_threadpool(image_digest, template.imagePath)
+    return watermark_settings.copy(
+        update={"image_file": template.imagePath, "image_sha256": digest}
+    )
@@ -0,0 +1,197 @@
+import enum
+import math
+from typing import Any, Dict, Optional, Tuple
+
+import prisma
+import prisma.enums
+from pydantic import BaseModel, confloat, root_validator, validator
+
+Affine = Tuple[float, float, float, float, float, float]
+
+# Largest page side the PDF format allows (200 inches), in points.
+MAX_PAGE_SIDE = 14400.0
+
+
+class Anchor(str, enum.Enum):
+    """
+    Point of the page the watermark is aligned to, inside the page margins.
+    AUTO places it wherever it covers the least page content.
+    """
+
+    TOP_LEFT = "top-left"
+    TOP = "top"
+    TOP_RIGHT = "top-right"
+    LEFT = "left"
+    CENTER = "center"
+    RIGHT = "right"
+    BOTTOM_LEFT = "bottom-left"
+    BOTTOM = "bottom"
+    BOTTOM_RIGHT = "bottom-right"
+    AUTO = "auto"
+
+    @property
+    def fractions(self) -> Tuple[float, float]:
+        """
+        Horizontal and vertical position of the anchor, from 0 (left/bottom) to 1 (right/top).
+        """
+        horizontal = 0.0 if "left" in self.value else 1.0 if "right" in self.value else 0.5
+        vertical = 0.0 if "bottom" in self.value else 1.0 if "top" in self.value else 0.5
+        return horizontal, vertical
+
+
+class Unit(str, enum.Enum):
+    """
+    Unit of offsets and margins. Percentages are relative to the page's width or height.
+    """
+
+    PT = "pt"
+    MM = "mm"
+    IN = "in"
+    PERCENT = "percent"
+
+    def to_points(self, value: float, extent: float) -> float:
+        """
+        Convert a length in this unit to PDF points.
+
+        Args:
+            value (float): The length to convert.
+            extent (float): Page width or height in points, used for percentages.
+
+        Returns:
+            float: The length in points.
+        """
+        if self is Unit.PERCENT:
+            return value * extent / 100
+        return value * {Unit.PT: 1.0, Unit.MM: 72 / 25.4, Unit.IN: 72.0}[self]
+
+    @property
+    def max_extent(self) -> float:
+        """
+        The side of the largest page PDF allows, in this unit.
+        """
+        if self is Unit.PERCENT:
+            return 100.0
+        return round(MAX_PAGE_SIDE / self.to_points(1.0, MAX_PAGE_SIDE), 6)
+
+
+class WatermarkSettings(BaseModel):
+    """
+    Defines the customization options for the watermark to be applied such as type, opacity, position, scale, and rotation.
+    """
+
+    type: prisma.enums.WatermarkType
+    text_content: Optional[str] = None
+    image_template_id: Optional[str] = None
+    # Set by resolve_watermark_image from the template's stored image, never by clients.
+    image_file: Optional[str] = None
+    image_sha256: Optional[str] = None
+    opacity: confloat(ge=0, le=1) = 0.5
+    position: Anchor = Anchor.CENTER
+    offset_x: float = 0
+    offset_y: float = 0
+    margin: confloat(ge=0) = 18
+    unit: Unit = Unit.PT
+    scale: confloat(gt=0, le=20) = 1
+    rotation: confloat(ge=-360, le=360) = 0
+
+    class Config:
+        frozen = True
+
+    @validator("position", pre=True)
+    def normalize_position(cls, value):
+        """
+        Accept the free-form spellings clients used before anchors were typed, e.g. 'Top Left'.
+        """
+        if isinstance(value, str):
+            return "-".join(value.strip().lower().replace("_", " ").replace("-", " ").split())
+        return value
+
+    @validator("image_file", "image_sha256")
+    def reject_image_file(cls, value, field):
+        """
+        Images are only ever read from stored templates, never from a client-supplied path or URL.
+        """
+        if value is not None:
+            raise ValueError(f"{field.name} cannot be set, use image_template_id")
+        return value
+
+    @validator("offset_x", "offset_y", "margin")
+    def reject_non_finite(cls, value, field):
+        """
+        NaN and infinity pass the range checks of plain floats but cannot be placed on a page.
+        """
+        if not math.isfinite(value):
+            raise ValueError(f"{field.name} must be a finite number")
+        return value
+
+    @root_validator(skip_on_failure=True)
+    def check_lengths(cls, values):
+        """
+        Offsets may move the watermark at most one page side, and margins may take up at most
+        half of it, measured on the largest page PDF allows in the settings' unit.
+        """
+        unit, limit = values["unit"], values["unit"].max_extent
+        for name in ("offset_x", "offset_y"):
+            if abs(values[name]) > limit:
+                raise ValueError(f"{name} must be within ±{limit:g} {unit.value}")
+        if values["margin"] > limit / 2:
+            raise ValueError(f"margin must be at most {limit / 2:g} {unit.value}")
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_content(cls, values):
+        if values["type"] == prisma.enums.WatermarkType.TEXT and not values.get(
+            "text_content"
+        ):
+            raise ValueError("text_content is required for TEXT watermarks")
+        if values["type"] == prisma.enums.WatermarkType.IMAGE and not values.get(
+            "image_template_id"
+        ):
+            raise ValueError("image_template_id is required for IMAGE watermarks")
+        return values
+
+    def base_transform(self, width: float, height: float) -> Affine:
+        """
+        The page-independent part of the watermark's placement: centre, scale, then rotate.
+
+        Args:
+            width (float): Natural width of the rendered watermark.
+            height (float): Natural height of the rendered watermark.
+
+        Returns:
+            Affine: Matrix (a, b, c, d, e, f) mapping the watermark onto the origin, so only a
+            translation remains to be computed per page.
+        """
+        theta = math.radians(self.rotation)
+        cos, sin = math.cos(theta) * self.scale, math.sin(theta) * self.scale
+        e = -(width / 2) * cos + (height / 2) * sin
+        f = -(width / 2) * sin - (height / 2) * cos
+        return (cos, sin, -sin, cos, e, f)
+
+    def half_extents(self, width: float, height: float) -> Tuple[float, float]:
+        """
+        Half the width and height of the watermark's bounding box once scaled and rotated.
+        """
+        theta = math.radians(self.rotation)
+        cos, sin = abs(math.cos(theta)), abs(math.sin(theta))
+        return (
+            self.scale * (width * cos + height * sin) / 2,
+            self.scale * (width * sin + height * cos) / 2,
+        )
+
+    def setting_data(self, user_id: str) -> Dict[str, Any]:
+        """
+        Column values of the WatermarkSetting row recording these settings for a user.
+        """
+        return {
+            "userId": user_id,
+            "opacity": self.opacity,
+            "position": self.position.value,
+            "offsetX": self.offset_x,
+            "offsetY": self.offset_y,
+            "margin": self.margin,
+            "unit": self.unit.value,
+            "scale": self.scale,
+            "rotation": self.rotation,
+            "watermarkType": self.type,
+        }
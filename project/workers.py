@@ -0,0 +1,36 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+# pdfium is not thread-safe: every call into it holds this lock, so that work run in a
+# thread of the server process cannot overlap another thread's. Pool workers run one job
+# at a time and never contend for it.
+pdfium_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    The shared pool of worker processes used for CPU-bound PDF work, created on first use.
+
+    Returns:
+        ProcessPoolExecutor: The process pool, sized by the WORKER_PROCESSES environment variable.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES)
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """
+    Stop the shared process pool, waiting for running work to finish.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True)
+        _process_pool = None
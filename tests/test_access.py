@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import prisma.enums
+import prisma.models
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from project import sessions
+from project.access import caller_id, require_role, require_session
+from project.sessions import issue_session_token
+from project.user_cache import UserCache
+
+
+class FakeUserTable:
+    def __init__(self, *users):
+        self.users = {user.id: user for user in users}
+
+    async def find_unique(self, where):
+        return self.users.get(where.get("id"))
+
+
+def _user(user_id, role, generation):
+    email = f"{user_id}@example.com"
+    return SimpleNamespace(
+        id=user_id, email=email, role=role, sessionGeneration=generation
+    )
+
+
+@pytest.fixture(autouse=True)
+def users(monkeypatch):
+    table = FakeUserTable(
+        _user("alice", prisma.enums.Role.USER, 0),
+        _user("root", prisma.enums.Role.ADMIN, 3),
+    )
+    monkeypatch.setattr(prisma.models.User, "prisma", classmethod(lambda cls: table))
+    cache = UserCache(ttl=60, capacity=10)
+    monkeypatch.setattr(sessions, "user_cache", cache)
+    monkeypatch.setattr("project.access.user_cache", cache)
+    return table
+
+
+def _request(token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return Request({"type": "http", "headers": headers, "client": ("192.0.2.1", 1)})
+
+
+def test_callers_are_identified_by_session_or_address():
+    caller = caller_id()
+    assert asyncio.run(caller(_request(issue_session_token("alice", 0)))) == "alice"
+    assert asyncio.run(caller(_request())) == "guest:192.0.2.1"
+    assert asyncio.run(caller(_request("alice.0.1.forged"))) == "guest:192.0.2.1"
+
+
+def test_require_session_rejects_anonymous_callers():
+    session = require_session()
+    assert asyncio.run(session(_request(issue_session_token("alice", 0)))) == "alice"
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(session(_request()))
+    assert raised.value.status_code == 401
+
+
+def test_require_role_checks_the_role_of_the_session_user():
+    admin = require_role(prisma.enums.Role.ADMIN)
+    asyncio.run(admin(_request(issue_session_token("root", 3))))
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(admin(_request(issue_session_token("alice", 0))))
+    assert raised.value.status_code == 403
@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import prisma.models
+import pytest
+
+from project import backfill as backfill_module
+from project.backfill import Checkpoint, backfill, load_checkpoint, save_checkpoint
+from project.watermark_settings import WatermarkSettings
+
+
+def _settings(text="DRAFT"):
+    return WatermarkSettings(type="TEXT", text_content=text)
+
+
+class FakeUploadTable:
+    def __init__(self, uploads):
+        self.uploads = uploads
+
+    def _after(self, where):
+        last_id = where["id"]["gt"] if where else ""
+        return [u for u in self.uploads if u.id > last_id]
+
+    async def find_many(self, where, order, take):
+        return self._after(where)[:take]
+
+    async def count(self, where):
+        return len(self._after(where))
+
+
+class FakeRowTable:
+    def __init__(self):
+        self.rows = {}
+
+    async def create_many(self, data, skip_duplicates):
+        for row in data:
+            self.rows.setdefault(row["id"], row)
+        return len(data)
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    uploads = [
+        SimpleNamespace(
+            id=f"u{i}",
+            userId="owner",
+            fileName=f"doc{i}.pdf",
+            path=str(tmp_path / f"doc{i}.pdf"),
+        )
+        for i in range(1, 7)
+    ]
+    tables = SimpleNamespace(
+        uploads=FakeUploadTable(uploads),
+        settings=FakeRowTable(),
+        watermarked=FakeRowTable(),
+    )
+    for model, table in (
+        (prisma.models.Upload, tables.uploads),
+        (prisma.models.WatermarkSetting, tables.settings),
+        (prisma.models.WatermarkedPDF, tables.watermarked),
+    ):
+        monkeypatch.setattr(model, "prisma", classmethod(lambda cls, t=table: t))
+    monkeypatch.setattr(backfill_module, "ProcessPoolExecutor", ThreadPoolExecutor)
+    return tables
+
+
+def _watermark_all_but(monkeypatch, broken):
+    done = []
+
+    def watermark_upload(upload_path, output_path, watermark_settings):
+        if upload_path.endswith(f"doc{broken}.pdf"):
+            raise BrokenProcessPool("worker died")
+        done.append(upload_path.rsplit("/", 1)[1])
+        return 100
+
+    monkeypatch.setattr(backfill_module, "watermark_upload", watermark_upload)
+    return done
+
+
+def test_checkpoint_round_trips_and_guards_its_settings(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = load_checkpoint(path, _settings(), restart=False)
+    save_checkpoint(path, checkpoint.copy(update={"last_id": "u2", "processed": 2}))
+    resumed = load_checkpoint(path, _settings(), restart=False)
+    assert (resumed.run_id, resumed.last_id) == (checkpoint.run_id, "u2")
+    with pytest.raises(SystemExit):
+        load_checkpoint(path, _settings("FINAL"), restart=False)
+    assert load_checkpoint(path, _settings("FINAL"), restart=True).last_id is None
+
+
+def test_an_interrupted_run_resumes_after_its_last_checkpoint(
+    monkeypatch, tmp_path, db, capsys
+):
+    path = str(tmp_path / "checkpoint.json")
+    first = _watermark_all_but(monkeypatch, broken=5)
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(backfill(_settings(), path, 2, 2, restart=False))
+    stored = Checkpoint.parse_file(path)
+    assert (stored.last_id, stored.processed) == ("u4", 4)
+    assert {f"doc{i}.pdf" for i in range(1, 5)} <= set(first)
+
+    second = _watermark_all_but(monkeypatch, broken=None)
+    final = asyncio.run(backfill(_settings(), path, 2, 2, restart=False))
+    assert sorted(second) == ["doc5.pdf", "doc6.pdf"]
+    assert (final.run_id, final.last_id, final.processed) == (stored.run_id, "u6", 6)
+    assert len(db.settings.rows) == len(db.watermarked.rows) == 6
+    assert {row["originalUploadId"] for row in db.watermarked.rows.values()} == {
+        f"u{i}" for i in range(1, 7)
+    }
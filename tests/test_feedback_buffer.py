@@ -0,0 +1,75 @@
+import asyncio
+
+import prisma.models
+import pytest
+
+from project import feedback_buffer as feedback_buffer_module
+from project.feedback_buffer import FLUSH_ATTEMPTS, FeedbackBuffer
+
+
+class FakeFeedbackTable:
+    def __init__(self, deleted_users=()):
+        self.deleted_users = set(deleted_users)
+        self.rows = []
+        self.calls = []
+
+    async def create_many(self, data):
+        self.calls.append(len(data))
+        if any(row["userId"] in self.deleted_users for row in data):
+            raise RuntimeError("Foreign key constraint failed on userId")
+        self.rows.extend(data)
+        return len(data)
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    async def sleep(delay):
+        pass
+
+    monkeypatch.setattr(feedback_buffer_module.asyncio, "sleep", sleep)
+
+
+def _table(monkeypatch, **kwargs):
+    table = FakeFeedbackTable(**kwargs)
+    monkeypatch.setattr(
+        prisma.models.Feedback, "prisma", classmethod(lambda cls: table)
+    )
+    return table
+
+
+def _submit_all(buffer, entries):
+    async def run():
+        for user_id, content in entries:
+            await buffer.submit(user_id, content)
+        await buffer.stop()
+
+    asyncio.run(run())
+
+
+def test_entries_are_written_in_batches(monkeypatch, no_backoff):
+    table = _table(monkeypatch)
+    buffer = FeedbackBuffer(capacity=100, batch_size=4, flush_interval=60)
+    _submit_all(buffer, [("u1", f"note {i}") for i in range(10)])
+    assert [row["content"] for row in table.rows] == [f"note {i}" for i in range(10)]
+    assert table.calls == [4, 4, 2]
+
+
+def test_a_bad_entry_only_costs_itself(monkeypatch, no_backoff):
+    table = _table(monkeypatch, deleted_users={"gone"})
+    buffer = FeedbackBuffer(capacity=100, batch_size=8, flush_interval=60)
+    entries = [("u1", f"note {i}") for i in range(8)]
+    entries[5] = ("gone", "orphan")
+    _submit_all(buffer, entries)
+    stored = {row["content"]: row["userId"] for row in table.rows}
+    assert stored == {
+        **{f"note {i}": "u1" for i in range(8) if i != 5},
+        "orphan": None,
+    }
+    assert table.calls[:FLUSH_ATTEMPTS] == [8] * FLUSH_ATTEMPTS
+
+
+def test_an_entry_failing_without_its_user_is_dropped(monkeypatch, no_backoff):
+    table = _table(monkeypatch, deleted_users={"gone", None})
+    buffer = FeedbackBuffer(capacity=100, batch_size=4, flush_interval=60)
+    _submit_all(buffer, [("u1", "kept"), ("gone", "lost")])
+    assert table.rows == [{"userId": "u1", "content": "kept"}]
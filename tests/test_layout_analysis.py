@@ -0,0 +1,108 @@
+import pytest
+
+from project.layout_analysis import (
+    GRID_SIZE,
+    LAYOUT_CHUNK_PAGES,
+    _user_to_view,
+    emptiest_center,
+    layout_chunks,
+)
+from project.page_index import PageIndex, PageInfo
+
+
+def _page(
+    width=240.0, height=240.0, rotation=0, crop_box=None, occupancy=None, number=0
+):
+    box = crop_box or (0.0, 0.0, width, height)
+    return PageInfo(
+        number=number,
+        media_box=box,
+        crop_box=box,
+        rotation=rotation,
+        object_number=1,
+        generation=0,
+        image_only=False,
+        occupancy=occupancy,
+    )
+
+
+def _grid(filled=lambda row, col: False):
+    return [
+        [1.0 if filled(row, col) else 0.0 for col in range(GRID_SIZE)]
+        for row in range(GRID_SIZE)
+    ]
+
+
+@pytest.mark.parametrize(
+    "rotation, point, expected",
+    [
+        (0, (60, 70), (10, 20)),
+        (90, (60, 70), (20, 190)),
+        (180, (60, 70), (190, 80)),
+        (270, (60, 70), (80, 10)),
+    ],
+)
+def test_user_to_view_applies_rotate(rotation, point, expected):
+    info = _page(crop_box=(50.0, 50.0, 250.0, 150.0), rotation=rotation)
+    assert _user_to_view(info, *point) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270, 450, -90])
+def test_user_to_view_maps_the_crop_box_onto_the_displayed_page(rotation):
+    info = _page(crop_box=(50.0, 50.0, 250.0, 150.0), rotation=rotation % 360)
+    corners = [
+        _user_to_view(info, x, y) for x in (50.0, 250.0) for y in (50.0, 150.0)
+    ]
+    xs, ys = zip(*corners)
+    assert (min(xs), max(xs)) == pytest.approx((0, info.width))
+    assert (min(ys), max(ys)) == pytest.approx((0, info.height))
+
+
+def test_empty_page_prefers_the_bottom_right_corner():
+    info = _page(occupancy=_grid())
+    assert emptiest_center(info, 20, 10, 0, 0) == pytest.approx((220, 10))
+
+
+def test_avoids_content_at_the_bottom():
+    info = _page(occupancy=_grid(lambda row, col: row < GRID_SIZE // 2))
+    assert emptiest_center(info, 20, 10, 0, 0) == pytest.approx((220, 230))
+
+
+def test_margins_are_kept():
+    info = _page(occupancy=_grid())
+    assert emptiest_center(info, 20, 10, 18, 12) == pytest.approx((202, 22))
+
+
+def test_finds_a_gap_away_from_the_preferred_anchors():
+    # Everything is covered except x 20-60, y 140-180.
+    hole = lambda row, col: not (14 <= row < 18 and 2 <= col < 6)  # noqa: E731
+    info = _page(occupancy=_grid(hole))
+    assert emptiest_center(info, 20, 20, 0, 0) == pytest.approx((40, 160))
+
+
+def test_watermark_larger_than_the_page_is_centred():
+    info = _page(occupancy=_grid())
+    assert emptiest_center(info, 200, 200, 0, 0) == pytest.approx((120, 120))
+
+
+def test_layout_chunks_skip_analysed_pages(tmp_path):
+    pages = [
+        _page(number=n, occupancy=_grid() if n % 3 == 0 else None) for n in range(30)
+    ]
+    index = PageIndex(sha256="0" * 64, file_size=1, page_count=30, pages=pages)
+    _, chunks = layout_chunks(str(tmp_path / "doc.pdf"), index)
+    missing = [info.number for chunk in chunks for info in chunk]
+    assert missing == [n for n in range(30) if n % 3]
+    assert [len(chunk) for chunk in chunks] == [LAYOUT_CHUNK_PAGES] * 2 + [4]
+    _, chunks = layout_chunks(str(tmp_path / "doc.pdf"), index, [0, 1, 3])
+    assert [[info.number for info in chunk] for chunk in chunks] == [[1]]
+
+
+def test_grids_are_stored_packed():
+    grid = _grid(lambda row, col: (row + col) % 3 == 0)
+    grid[5][7] = 0.5
+    info = _page(occupancy=grid)
+    assert len(info.occupancy) == 768
+    flat = [value for row in info.grid for value in row]
+    assert flat == pytest.approx([value for row in grid for value in row], abs=1 / 255)
+    assert PageInfo.parse_raw(info.json()).grid == info.grid
@@ -0,0 +1,84 @@
+import os
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NameObject, NumberObject
+
+from project import page_index as page_index_module
+from project.page_index import (
+    build_page_index,
+    load_page_index,
+    read_page,
+    stored_page_index,
+)
+from project.storage import sidecar_path
+
+
+def _write_pdf(path, sizes, inherited_rotation=None):
+    writer = PdfWriter()
+    for width, height in sizes:
+        writer.add_blank_page(width=width, height=height)
+    if inherited_rotation is not None:
+        writer._root_object["/Pages"].get_object()[NameObject("/Rotate")] = (
+            NumberObject(inherited_rotation)
+        )
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_index_records_the_geometry_of_every_page(tmp_path):
+    path = _write_pdf(tmp_path / "doc.pdf", [(200, 100), (300, 400)])
+    index = build_page_index(path)
+    assert index.page_count == 2
+    assert index.file_size == os.path.getsize(path)
+    assert [info.media_box for info in index.pages] == [
+        (0.0, 0.0, 200.0, 100.0),
+        (0.0, 0.0, 300.0, 400.0),
+    ]
+    assert [(info.width, info.height) for info in index.pages] == [
+        (200.0, 100.0),
+        (300.0, 400.0),
+    ]
+    assert not any(info.image_only for info in index.pages)
+
+
+def test_inherited_rotation_is_indexed_and_copied_onto_read_pages(tmp_path):
+    path = _write_pdf(tmp_path / "doc.pdf", [(200, 100)] * 3, inherited_rotation=90)
+    index = build_page_index(path)
+    assert [info.rotation for info in index.pages] == [90] * 3
+    assert (index.pages[0].width, index.pages[0].height) == (100.0, 200.0)
+
+    reader = PdfReader(path)
+    page = read_page(reader, index.pages[2])
+    assert page["/Rotate"] == 90
+    assert page.indirect_reference.idnum == index.pages[2].object_number
+    assert float(page.mediabox.right) == 200.0
+
+
+def test_index_is_built_once_and_read_back_from_its_sidecar(tmp_path, monkeypatch):
+    path = _write_pdf(tmp_path / "doc.pdf", [(200, 100)])
+    assert stored_page_index(path) is None
+    index = load_page_index(path)
+    assert os.path.exists(sidecar_path(path, "index.json"))
+
+    def fail(path):
+        raise AssertionError("the PDF was parsed again")
+
+    monkeypatch.setattr(page_index_module, "build_page_index", fail)
+    assert load_page_index(path) == index
+
+
+def test_indexes_of_another_version_are_rebuilt(tmp_path, monkeypatch):
+    path = _write_pdf(tmp_path / "doc.pdf", [(200, 100)])
+    index = load_page_index(path)
+    monkeypatch.setattr(page_index_module, "INDEX_VERSION", 2)
+    assert stored_page_index(path) is None
+    builds = []
+    monkeypatch.setattr(
+        page_index_module,
+        "build_page_index",
+        lambda path: builds.append(path) or index.copy(update={"version": 2}),
+    )
+    load_page_index(path)
+    assert builds == [path]
+    assert stored_page_index(path).version == 2
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from project import preview_cache as preview_cache_module
+from project.preview_cache import PREVIEW_CACHE_CONTROL, PreviewCache
+
+STEM = "0f9e2c4a"
+
+KEY = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def preview_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(preview_cache_module, "PREVIEW_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _store(cache, preview_dir, name, size, mtime):
+    path = str(preview_dir / f"{STEM}-{name}.webp")
+    cache.store(path, b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_least_recently_used_previews_are_evicted(preview_dir):
+    cache = PreviewCache(max_bytes=1000)
+    paths = [
+        _store(cache, preview_dir, name, 300, mtime)
+        for name, mtime in (("a", 100), ("b", 200), ("c", 300))
+    ]
+    os.utime(paths[0], (400, 400))
+    _store(cache, preview_dir, "d", 300, 500)
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    assert cache.metrics().evictions == 1
+    assert cache.metrics().bytes == 900
+
+
+def test_eviction_goes_below_the_bound(preview_dir):
+    cache = PreviewCache(max_bytes=1000)
+    for i in range(5):
+        _store(cache, preview_dir, str(i), 200, 100 + i)
+    _store(cache, preview_dir, "5", 200, 200)
+    remaining = sorted(path.name for path in preview_dir.iterdir())
+    assert remaining == [f"{STEM}-{i}.webp" for i in range(2, 6)]
+    assert cache.metrics().bytes <= 900
+
+
+def test_lookup_counts_hits_and_misses(preview_dir):
+    cache = PreviewCache(max_bytes=1000)
+    path = _store(cache, preview_dir, "a", 10, 100)
+    assert cache.lookup(path)
+    assert os.stat(path).st_mtime > 100
+    assert not cache.lookup(str(preview_dir / f"{STEM}-b.webp"))
+    assert (cache.metrics().hits, cache.metrics().misses) == (1, 1)
+
+
+def test_previews_are_served_with_their_key_as_etag(preview_dir):
+    cache = PreviewCache(max_bytes=1000)
+    _store(cache, preview_dir, KEY, 10, 100)
+    response = cache.response(f"{STEM}-{KEY}.webp", None)
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{KEY}"'
+    assert response.headers["cache-control"] == PREVIEW_CACHE_CONTROL
+
+
+@pytest.mark.parametrize(
+    "if_none_match", [f'"{KEY}"', f'W/"{KEY}"', f'"other", "{KEY}"', "*"]
+)
+def test_current_copies_are_not_modified(preview_dir, if_none_match):
+    cache = PreviewCache(max_bytes=1000)
+    response = cache.response(f"{STEM}-{KEY}.webp", if_none_match)
+    assert response.status_code == 304
+    assert response.headers["etag"] == f'"{KEY}"'
+
+
+@pytest.mark.parametrize(
+    "name",
+    [f"{STEM}-{KEY}.webp", "../secret.webp", f"{STEM}-{KEY}.png", f"{STEM}-abc.webp"],
+)
+def test_unknown_previews_are_not_found(preview_dir, name):
+    cache = PreviewCache(max_bytes=1000)
+    assert cache.response(name, '"stale"').status_code == 404
@@ -0,0 +1,68 @@
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from project.profiling import (
+    Profiler,
+    ProfileOptions,
+    ProfileReport,
+    ProfileStore,
+    page_span,
+    run_profiled,
+)
+
+
+def _report(report_id, wall_ms):
+    return ProfileReport(
+        id=report_id,
+        job="apply",
+        document_id="doc",
+        profiler=Profiler.SAMPLING,
+        wall_ms=wall_ms,
+        collapsed="",
+        pages=[],
+    )
+
+
+def test_record_keeps_the_slowest_reports():
+    store = ProfileStore(rate=1, keep=2)
+    for report_id, wall_ms in [("a", 30), ("b", 10), ("c", 50), ("d", 20)]:
+        store.record(_report(report_id, wall_ms))
+    assert [summary.id for summary in store.slowest()] == ["c", "a"]
+    assert store.get("c").wall_ms == 50
+    assert store.get("b") is None
+    assert store.get("d") is None
+
+
+def test_record_ignores_unprofiled_jobs():
+    store = ProfileStore(rate=1, keep=2)
+    store.record(None)
+    assert store.slowest() == []
+
+
+def test_sample_is_off_when_the_rate_is_zero():
+    assert ProfileStore(rate=0, keep=2).sample("apply", "doc") is None
+    options = ProfileStore(rate=1, keep=2).sample("apply", "doc")
+    assert (options.job, options.document_id) == ("apply", "doc")
+
+
+def _job(size):
+    with page_span("stamp", 0):
+        data = bytearray(size)
+        time.sleep(0.02)
+    return len(data)
+
+
+def test_overlapping_memory_profiles_each_get_a_report():
+    options = ProfileOptions(
+        job="apply", document_id="doc", profiler=Profiler.SAMPLING, memory=True
+    )
+    with ThreadPoolExecutor(4) as executor:
+        results = list(
+            executor.map(lambda size: run_profiled(options, _job, size), [1 << 20] * 4)
+        )
+    for size, report in results:
+        assert size == 1 << 20
+        assert report.memory.peak_kb >= 1024
+        assert report.pages[0].peak_kb >= 1024
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,53 @@
+import asyncio
+
+import prisma.enums
+import pytest
+from fastapi import HTTPException
+
+from project import rate_limit
+from project.rate_limit import RateLimit, RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_admits_a_burst_then_reports_the_wait(clock):
+    bucket = TokenBucket(RateLimit(rate=2, burst=4))
+    assert [bucket.take(1) for _ in range(4)] == [0.0] * 4
+    assert bucket.take(1) == pytest.approx(0.5)
+
+
+def test_bucket_refills_over_time_up_to_its_burst(clock):
+    bucket = TokenBucket(RateLimit(rate=2, burst=4))
+    bucket.take(4)
+    clock[0] += 0.5
+    assert bucket.take(1) == 0.0
+    assert bucket.take(1) == pytest.approx(0.5)
+    clock[0] += 60
+    assert bucket.take(4) == 0.0
+    assert bucket.take(1) > 0
+
+
+def test_refund_returns_tokens_without_exceeding_the_burst(clock):
+    bucket = TokenBucket(RateLimit(rate=1, burst=5))
+    bucket.take(3)
+    bucket.refund(3)
+    assert bucket.tokens == 5
+    bucket.refund(10)
+    assert bucket.tokens == 5
+
+
+def test_user_bucket_is_refunded_when_the_role_bucket_rejects(clock):
+    limiter = RateLimiter()
+    limiter._roles[prisma.enums.Role.GUEST].tokens = 0
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(limiter.check("192.0.2.1", None, 1))
+    assert raised.value.status_code == 429
+    assert int(raised.value.headers["Retry-After"]) >= 1
+    guest = limiter._buckets["guest:192.0.2.1"]
+    assert guest.tokens == guest.limit.burst
+    assert limiter.metrics().rejected == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import orjson
+import pytest
+from pydantic import BaseModel
+
+from project.responses import (
+    ErrorResponseMiddleware,
+    FastJSONResponse,
+    model_response,
+)
+
+
+class Listing(BaseModel):
+    name: str
+    thumbnails: dict
+
+
+def test_non_string_keys_are_serialised():
+    response = FastJSONResponse({"thumbnails": {64: "/thumbnails/a-64.webp"}})
+    assert orjson.loads(response.body) == {
+        "thumbnails": {"64": "/thumbnails/a-64.webp"}
+    }
+    assert response.headers["content-type"] == "application/json"
+
+
+def test_models_are_serialised_without_validation():
+    listing = Listing.construct(name="doc.pdf", thumbnails={256: "/t.webp"})
+    response = model_response(listing, status_code=201)
+    assert response.status_code == 201
+    assert orjson.loads(response.body) == {
+        "name": "doc.pdf",
+        "thumbnails": {"256": "/t.webp"},
+    }
+
+
+def _call(app):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+    asyncio.run(ErrorResponseMiddleware(app)(scope, receive, send))
+    return messages
+
+
+def test_unhandled_errors_become_a_json_500():
+    async def app(scope, receive, send):
+        raise ValueError("boom")
+
+    start, body = _call(app)
+    assert start["status"] == 500
+    assert orjson.loads(body["body"]) == {"error": "boom"}
+
+
+def test_errors_after_the_response_started_are_re_raised():
+    async def app(scope, receive, send):
+        await FastJSONResponse({"ok": True})(scope, receive, send)
+        raise ValueError("in a background task")
+
+    with pytest.raises(ValueError):
+        _call(app)
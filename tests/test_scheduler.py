@@ -0,0 +1,104 @@
+import asyncio
+
+from project.scheduler import FairShareScheduler, Priority
+
+
+async def _run_jobs(slots, jobs):
+    """
+    Hold every slot with a gate job, queue `jobs` behind it, then open the gate and
+    return the labels in the order the jobs were granted a slot.
+    """
+    scheduler = FairShareScheduler(slots)
+    gate = asyncio.Event()
+    order = []
+
+    async def job(user_id, priority, label):
+        async with scheduler.slot(user_id, priority):
+            order.append(label)
+            if label == "gate":
+                await gate.wait()
+
+    tasks = [asyncio.create_task(job("holder", Priority.BULK, "gate"))]
+    await asyncio.sleep(0)
+    for user_id, priority, label in jobs:
+        tasks.append(asyncio.create_task(job(user_id, priority, label)))
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_users_are_served_round_robin():
+    jobs = [
+        ("alice", Priority.BULK, "a1"),
+        ("alice", Priority.BULK, "a2"),
+        ("alice", Priority.BULK, "a3"),
+        ("bob", Priority.BULK, "b1"),
+    ]
+    order = asyncio.run(_run_jobs(1, jobs))
+    assert order == ["gate", "a1", "b1", "a2", "a3"]
+
+
+def test_interactive_jobs_go_before_bulk_jobs():
+    jobs = [
+        ("alice", Priority.BULK, "bulk"),
+        ("bob", Priority.INTERACTIVE, "interactive"),
+    ]
+    order = asyncio.run(_run_jobs(1, jobs))
+    assert order == ["gate", "interactive", "bulk"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = FairShareScheduler(1)
+        gate = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("holder", Priority.BULK):
+                await gate.wait()
+
+        async def wait():
+            async with scheduler.slot("alice", Priority.BULK):
+                pass
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(wait())
+        await asyncio.sleep(0)
+        assert scheduler.metrics().queues["bulk"].queued == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.metrics().queues["bulk"].queued == 0
+        gate.set()
+        await holder
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.running == 0
+
+
+def test_cancelling_a_running_job_releases_its_slot():
+    async def scenario():
+        scheduler = FairShareScheduler(1)
+        granted = []
+
+        async def hold():
+            async with scheduler.slot("holder", Priority.BULK):
+                await asyncio.Event().wait()
+
+        async def wait():
+            async with scheduler.slot("alice", Priority.BULK):
+                granted.append("alice")
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(wait())
+        await asyncio.sleep(0)
+        holder.cancel()
+        await asyncio.gather(holder, return_exceptions=True)
+        await waiter
+        return scheduler, granted
+
+    scheduler, granted = asyncio.run(scenario())
+    assert granted == ["alice"]
+    assert scheduler.running == 0
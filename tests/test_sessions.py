@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import prisma.models
+import pytest
+from starlette.requests import Request
+
+from project import logout_user_service, sessions
+from project.logout_user_service import logout_user
+from project.sessions import issue_session_token, session_user_id, verify_session_token
+from project.user_cache import UserCache
+
+
+class FakeUserTable:
+    def __init__(self, *users):
+        self.users = {user.id: user for user in users}
+
+    async def find_unique(self, where):
+        return self.users.get(where.get("id"))
+
+    async def update_many(self, where, data):
+        user = self.users.get(where["id"])
+        if user is None or user.sessionGeneration != where["sessionGeneration"]:
+            return 0
+        user.sessionGeneration += data["sessionGeneration"]["increment"]
+        return 1
+
+
+@pytest.fixture
+def table(monkeypatch):
+    alice = SimpleNamespace(id="alice", email="alice@example.com", sessionGeneration=0)
+    table = FakeUserTable(alice)
+    monkeypatch.setattr(prisma.models.User, "prisma", classmethod(lambda cls: table))
+    cache = UserCache(ttl=60, capacity=10)
+    monkeypatch.setattr(sessions, "user_cache", cache)
+    monkeypatch.setattr(logout_user_service, "user_cache", cache)
+    return table
+
+
+def _request(token):
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+    return Request({"type": "http", "headers": headers})
+
+
+def test_tokens_carry_the_user_and_generation():
+    assert verify_session_token(issue_session_token("alice", 4)) == ("alice", 4)
+
+
+def test_forged_and_expired_tokens_are_rejected(monkeypatch):
+    token = issue_session_token("alice", 0)
+    user_id, generation, expires, signature = token.split(".")
+    assert verify_session_token(f"mallory.{generation}.{expires}.{signature}") is None
+    assert verify_session_token(f"{user_id}.{generation}.{expires}") is None
+    assert verify_session_token("") is None
+    monkeypatch.setattr(sessions.time, "time", lambda: int(expires) + 1)
+    assert verify_session_token(token) is None
+
+
+def test_logout_revokes_every_session_of_the_user(table):
+    first, second = issue_session_token("alice", 0), issue_session_token("alice", 0)
+    assert asyncio.run(session_user_id(_request(first))) == "alice"
+    response = asyncio.run(logout_user(first))
+    assert response.message == "Session successfully terminated."
+    assert asyncio.run(session_user_id(_request(first))) is None
+    assert asyncio.run(session_user_id(_request(second))) is None
+    asyncio.run(logout_user(second))
+    assert table.users["alice"].sessionGeneration == 1
+    fresh = issue_session_token("alice", 1)
+    assert asyncio.run(session_user_id(_request(fresh))) == "alice"
+
+
+def test_logout_with_an_invalid_token_changes_nothing(table):
+    response = asyncio.run(logout_user("alice.0.1.forged"))
+    assert response.message == "Session not found or already expired."
+    assert table.users["alice"].sessionGeneration == 0
@@ -0,0 +1,25 @@
+from PIL import Image
+from pypdf import PdfWriter
+
+from project import thumbnails as thumbnails_module
+from project.thumbnails import THUMBNAIL_SIZES, generate_thumbnails, thumbnail_urls
+
+
+def test_thumbnails_are_generated_at_every_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails_module, "THUMBNAIL_DIR", str(tmp_path / "thumbs"))
+    upload_path = str(tmp_path / "0f9e2c4a.pdf")
+    writer = PdfWriter()
+    writer.add_blank_page(width=300, height=600)
+    with open(upload_path, "wb") as f:
+        writer.write(f)
+
+    assert thumbnail_urls(upload_path) == {}
+    paths = generate_thumbnails(upload_path)
+    assert sorted(paths) == sorted(THUMBNAIL_SIZES)
+    for size, path in paths.items():
+        with Image.open(path) as image:
+            assert image.format == "WEBP"
+            assert image.size == (size // 2, size)
+    assert thumbnail_urls(upload_path) == {
+        size: f"/thumbnails/0f9e2c4a-{size}.webp" for size in THUMBNAIL_SIZES
+    }
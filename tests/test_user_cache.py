@@ -0,0 +1,182 @@
+import asyncio
+from types import SimpleNamespace
+
+import prisma.enums
+import prisma.models
+import pytest
+
+from project import user_cache as user_cache_module
+from project.user_cache import (
+    InvalidationChannel,
+    LocalInvalidationChannel,
+    PostgresInvalidationChannel,
+    UserCache,
+    UserInvalidation,
+)
+
+
+class FakeUserTable:
+    def __init__(self, *users):
+        self.users = {user.id: user for user in users}
+        self.lookups = []
+        self.during_lookup = None
+
+    async def find_unique(self, where):
+        self.lookups.append(where)
+        ((field, value),) = where.items()
+        user = next(
+            (u for u in self.users.values() if getattr(u, field) == value), None
+        )
+        if self.during_lookup is not None:
+            self.during_lookup()
+        return user
+
+
+def _user(user_id, email, role=prisma.enums.Role.USER):
+    return SimpleNamespace(id=user_id, email=email, role=role)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeUserTable(_user("u1", "one@example.com"))
+    monkeypatch.setattr(prisma.models.User, "prisma", classmethod(lambda cls: table))
+    return table
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_lookups_are_served_from_the_cache(table, clock):
+    cache = UserCache(ttl=60, capacity=10)
+    assert asyncio.run(cache.get_by_id("u1")).email == "one@example.com"
+    assert asyncio.run(cache.get_by_id("u1")).id == "u1"
+    assert asyncio.run(cache.get_by_email("one@example.com")).id == "u1"
+    assert len(table.lookups) == 1
+    assert cache.metrics().hits == 2
+
+
+def test_entries_expire(table, clock):
+    cache = UserCache(ttl=60, capacity=10)
+    asyncio.run(cache.get_by_id("u1"))
+    clock[0] += 61
+    asyncio.run(cache.get_by_id("u1"))
+    assert len(table.lookups) == 2
+
+
+def test_invalidate_drops_the_user_by_id_and_email(table, clock):
+    cache = UserCache(ttl=60, capacity=10)
+    asyncio.run(cache.get_by_id("u1"))
+    table.users["u1"] = _user("u1", "one@example.com", prisma.enums.Role.ADMIN)
+    cache.invalidate(user_id="u1")
+    user = asyncio.run(cache.get_by_email("one@example.com"))
+    assert user.role == prisma.enums.Role.ADMIN
+    assert len(table.lookups) == 2
+
+
+def test_invalidation_reaches_other_caches_on_the_channel(table, clock):
+    channel = LocalInvalidationChannel()
+    first = UserCache(ttl=60, capacity=10, channel=channel)
+    second = UserCache(ttl=60, capacity=10, channel=channel)
+    asyncio.run(first.get_by_id("u1"))
+    asyncio.run(second.get_by_id("u1"))
+    first.invalidate(email="one@example.com")
+    asyncio.run(second.get_by_id("u1"))
+    assert len(table.lookups) == 3
+    assert first.metrics().invalidations == 1
+    assert second.metrics().invalidations == 1
+
+
+def test_load_overlapping_an_invalidation_is_not_stored(table, clock):
+    cache = UserCache(ttl=60, capacity=10)
+    table.during_lookup = lambda: cache.invalidate(user_id="u1")
+    assert asyncio.run(cache.get_by_id("u1")) is not None
+    table.during_lookup = None
+    asyncio.run(cache.get_by_id("u1"))
+    assert len(table.lookups) == 2
+    asyncio.run(cache.get_by_id("u1"))
+    assert len(table.lookups) == 2
+
+
+def test_missing_users_are_cached_until_invalidated(table, clock):
+    cache = UserCache(ttl=60, capacity=10)
+    assert asyncio.run(cache.get_by_id("ghost")) is None
+    assert asyncio.run(cache.get_by_id("ghost")) is None
+    assert asyncio.run(cache.get_by_email("ghost@example.com")) is None
+    assert len(table.lookups) == 2
+    table.users["ghost"] = _user("ghost", "ghost@example.com")
+    cache.invalidate(user_id="ghost", email="ghost@example.com")
+    assert asyncio.run(cache.get_by_id("ghost")).id == "ghost"
+    assert asyncio.run(cache.get_by_email("ghost@example.com")).id == "ghost"
+    assert len(table.lookups) == 3
+
+
+def test_least_recently_used_user_is_evicted(table, clock):
+    table.users["u2"] = _user("u2", "two@example.com")
+    table.users["u3"] = _user("u3", "three@example.com")
+    cache = UserCache(ttl=60, capacity=2)
+    for user_id in ("u1", "u2", "u1", "u3"):
+        asyncio.run(cache.get_by_id(user_id))
+    assert cache.metrics().evictions == 1
+    asyncio.run(cache.get_by_id("u1"))
+    asyncio.run(cache.get_by_id("u2"))
+    assert [where["id"] for where in table.lookups] == ["u1", "u2", "u3", "u2"]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+
+    def is_closed(self):
+        return False
+
+    async def execute(self, query, *args):
+        self.queries.append((query, *args))
+
+    async def close(self):
+        pass
+
+
+def test_channels_must_implement_publish_and_subscribe():
+    with pytest.raises(TypeError):
+        InvalidationChannel()
+
+
+def test_postgres_channel_drops_prisma_only_url_parameters():
+    channel = PostgresInvalidationChannel(
+        "postgresql://u:p@db:5432/app?schema=public&sslmode=require&connection_limit=5"
+    )
+    assert channel.dsn == "postgresql://u:p@db:5432/app?sslmode=require"
+
+
+def test_postgres_channel_notifies_and_delivers(table, clock):
+    channel = PostgresInvalidationChannel("postgresql://db/app")
+    cache = UserCache(ttl=60, capacity=10, channel=channel)
+    connection = channel._connection = FakeConnection()
+
+    async def invalidate():
+        cache.invalidate(email="one@example.com")
+        await channel.stop()
+
+    asyncio.run(invalidate())
+    ((query, name, payload),) = connection.queries
+    assert name == channel.channel
+    assert UserInvalidation.parse_raw(payload).email == "one@example.com"
+
+    asyncio.run(cache.get_by_id("u1"))
+    message = UserInvalidation(origin="other-worker", user_id="u1")
+    channel._on_notification(connection, 1, channel.channel, message.json())
+    channel._on_notification(connection, 1, channel.channel, payload)
+    assert cache.metrics().invalidations == 2
+    asyncio.run(cache.get_by_id("u1"))
+    assert len(table.lookups) == 2
+
+
+def test_postgres_channel_does_not_fail_writes_when_disconnected(table, clock):
+    channel = PostgresInvalidationChannel("postgresql://db/app")
+    cache = UserCache(ttl=60, capacity=10, channel=channel)
+    cache.invalidate(user_id="u1")
+    assert cache.metrics().invalidations == 1
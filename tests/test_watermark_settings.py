@@ -0,0 +1,72 @@
+import pytest
+from pydantic import ValidationError
+
+from project.watermark_settings import Anchor, Unit, WatermarkSettings
+
+
+def _settings(**values):
+    return WatermarkSettings(**{"type": "TEXT", "text_content": "DRAFT", **values})
+
+
+@pytest.mark.parametrize(
+    "spelling, anchor",
+    [
+        ("Top Left", Anchor.TOP_LEFT),
+        ("bottom_right", Anchor.BOTTOM_RIGHT),
+        ("  CENTER ", Anchor.CENTER),
+        ("top-right", Anchor.TOP_RIGHT),
+        ("Auto", Anchor.AUTO),
+    ],
+)
+def test_free_form_positions_are_normalised(spelling, anchor):
+    assert _settings(position=spelling).position is anchor
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"opacity": 1.5},
+        {"scale": 0},
+        {"rotation": 400},
+        {"position": "upper middle"},
+        {"offset_x": float("nan")},
+        {"offset_y": float("-inf")},
+        {"margin": float("inf")},
+        {"margin": -1},
+        {"offset_x": 14401},
+        {"offset_y": -201, "unit": "in"},
+        {"margin": 51, "unit": "percent"},
+        {"image_file": "/etc/passwd"},
+        {"image_sha256": "0" * 64},
+    ],
+)
+def test_out_of_range_settings_are_rejected(values):
+    with pytest.raises(ValidationError):
+        _settings(**values)
+
+
+def test_lengths_up_to_the_largest_page_are_accepted():
+    settings = _settings(offset_x=-5080, offset_y=5080, margin=2540, unit="mm")
+    assert (settings.offset_x, settings.margin) == (-5080, 2540)
+    assert _settings(offset_x=100, margin=50, unit="percent").offset_x == 100
+
+
+def test_content_is_required_for_the_watermark_type():
+    with pytest.raises(ValidationError):
+        WatermarkSettings(type="TEXT")
+    with pytest.raises(ValidationError):
+        WatermarkSettings(type="IMAGE", text_content="DRAFT")
+    assert WatermarkSettings(type="IMAGE", image_template_id="t1").scale == 1
+
+
+@pytest.mark.parametrize(
+    "unit, value, points",
+    [
+        (Unit.PT, 10, 10),
+        (Unit.MM, 25.4, 72),
+        (Unit.IN, 2, 144),
+        (Unit.PERCENT, 25, 150),
+    ],
+)
+def test_lengths_are_converted_to_points(unit, value, points):
+    assert unit.to_points(value, 600) == pytest.approx(points)